@@ -0,0 +1,226 @@
+import argparse
+import contextlib
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+
+from utils import metrics
+from utils.annotations import load_cut_table, load_offset_table
+from utils.ledger import JobLedger
+from utils.manifest import write_manifest
+from utils.sessions import ANGLES, SHEET_BY_GAME, find_data_collection_files, parse_video_name, session_code
+
+# --- CONFIGURATION ---
+excel_folder = '/data/sda1/cv_slice_data/excel'                       # DataCollection_XX.xlsx files
+offset_excel_path = '/data/sda1/cv_slice_data/new_csv_offset.xlsx'    # one sheet per session, e.g. '25.1.17_13'
+raw_video_base_path = '/data/sda1/mocap_data/raw_video'               # {session}/{code}_{game}_{angle}.mp4
+raw_csv_base_path = '/data/sda1/mocap_data/smoothed'                  # raw OptiTrack exports
+extracted_csv_path = '/data/sda1/cv_slice_data/extracted_csv'         # {session}/{code}_{game}_{angle}_3d.csv
+output_path = '/data/sda1/cv_slice_data/output'                       # csv/ and videos/ slices go here
+log_path = os.path.join(output_path, 'logs')                          # one log file per job
+stages = ('extract', 'csv', 'video')
+track_format = 'csv'                                                  # extracted tracks: 'csv' or 'npy' (utils/track_io.py)
+slice_format = 'csv'                                                  # keypoint slices: 'csv', 'npy' or 'manifest'
+resample = None                                                       # None: mocap row i = video frame i; 'nearest' / 'linear': align by timestamps
+num_workers = os.cpu_count()
+incremental = True                                                    # only rebuild outputs whose inputs changed (ledger.sqlite)
+
+
+# --- Build one job per (session, sheet, angle) from the excel folder and the offset workbook ---
+def build_jobs(excel_folder, offset_excel_path, sessions=None, angles=ANGLES, skipped=None):
+    # skipped: optional list that collects (session, video_name, reason) for every offset row left out
+    # for a data problem (angles outside `angles` are a choice, not a problem, and are not listed)
+    data_collection_files = find_data_collection_files(excel_folder)
+    offset_table = load_offset_table(offset_excel_path)
+    if skipped is None:
+        skipped = []
+
+    jobs = []
+    for session_folder, offset_df in offset_table.groupby('session', sort=False):
+        code = session_code(session_folder)
+        if sessions and code not in sessions:
+            continue
+        if code not in data_collection_files:
+            print(f"[WARN] no DataCollection_{code}.xlsx for offset sheet {session_folder}, skipping")
+            skipped += [(session_folder, v, f"no DataCollection_{code}.xlsx") for v in offset_df['video_name']]
+            continue
+
+        for row in offset_df.itertuples(index=False):
+            video_name = row.video_name
+            try:
+                _, game, angle = parse_video_name(video_name)
+            except ValueError:
+                print(f"[WARN] unrecognized video name {video_name} in {session_folder}, skipping")
+                skipped.append((session_folder, video_name, "unrecognized video name"))
+                continue
+            if angle not in angles:
+                continue
+            if game not in SHEET_BY_GAME:
+                print(f"[WARN] unknown game '{game}' in {video_name} ({session_folder}), skipping")
+                skipped.append((session_folder, video_name, f"unknown game '{game}'"))
+                continue
+            jobs.append({
+                'session': session_folder,
+                'code': code,
+                'sheet': SHEET_BY_GAME[game],
+                'angle': angle,
+                'video_name': video_name,
+                'csv_name': row.csv_name,
+                'offset': row.offset,
+                'excel_path': data_collection_files[code],
+                'offset_df': offset_df,
+            })
+    return jobs
+
+
+def job_id(job):
+    return f"{job['session']}_{os.path.splitext(job['video_name'])[0]}"
+
+
+def run_stages(job, stages, slice_mode):
+    # ledgers are shared by all workers; sqlite serialises the writes
+    with contextlib.ExitStack() as stack:
+        track_ledger = stack.enter_context(JobLedger(extracted_csv_path)) if incremental else None
+        slice_ledger = stack.enter_context(JobLedger(output_path)) if incremental else None
+        return _run_stages(job, stages, slice_mode, track_ledger, slice_ledger)
+
+
+def _run_stages(job, stages, slice_mode, track_ledger, slice_ledger):
+    # imported here so each worker process loads the pipeline modules itself
+    from slice_csv import slice_csv_based_on_offsets
+    from slice_video import collect_clip_ranges, slice_video_file
+    from sync_all_video import get_video_frame_count, track_fingerprint
+    from utils.extract_24_keypoint_from_csv import extract_3d_points_from_csv
+    from utils.frame_index import load_frame_index
+
+    video_stem = os.path.splitext(job['video_name'])[0]
+    video_path = os.path.join(raw_video_base_path, job['session'], job['video_name'])
+    track_name = f"{video_stem}_3d.{track_format}"
+    track_path = os.path.join(extracted_csv_path, job['session'], track_name)
+
+    if 'extract' in stages:
+        with metrics.span('stage.extract', job=job_id(job)):
+            raw_csv_path = os.path.join(raw_csv_base_path, job['csv_name'])
+            if track_ledger is None and os.path.exists(track_path):
+                print(f"已存在输出文件: {track_path}，跳过。")
+            else:
+                total_frames = get_video_frame_count(video_path)
+                if total_frames <= 0:
+                    raise RuntimeError(f"无法读取视频帧数: {video_path}")
+                fingerprint = None
+                if track_ledger is not None:
+                    fingerprint = track_fingerprint(track_ledger, raw_csv_path, job['offset'], total_frames,
+                                                    resample=resample, video_path=video_path)
+                if fingerprint is not None and track_ledger.is_current(track_path, fingerprint):
+                    print(f"输出文件已是最新: {track_path}，跳过。")
+                else:
+                    os.makedirs(os.path.dirname(track_path), exist_ok=True)
+                    frame_times = load_frame_index(video_path)['times'] if resample else None
+                    extract_3d_points_from_csv(raw_csv_path, track_path, total_frames=total_frames,
+                                               offset=job['offset'], frame_times=frame_times,
+                                               resample=resample or 'linear')
+                    if track_ledger is not None:
+                        track_ledger.record(track_path, fingerprint, source=raw_csv_path, video=job['video_name'],
+                                            offset=int(job['offset']), total_frames=int(total_frames))
+
+    manifest = []
+    if 'csv' in stages:
+        with metrics.span('stage.csv', job=job_id(job)):
+            manifest = slice_csv_based_on_offsets(track_path, job['sheet'], track_name,
+                                       job['excel_path'], os.path.join(output_path, 'csv'), job['offset_df'],
+                                       output_format=slice_format,
+                                       ledger=slice_ledger if slice_format != 'manifest' else None,
+                                       video_name=job['video_name'])
+
+    if 'video' in stages:
+        with metrics.span('stage.video', job=job_id(job), mode=slice_mode):
+            output_folder = os.path.join(output_path, 'videos', video_stem)
+            os.makedirs(output_folder, exist_ok=True)
+            cut_table = load_cut_table(job['excel_path'])
+            cuts = cut_table[cut_table['sheet'] == job['sheet']]
+            clips = collect_clip_ranges(cuts, job['video_name'], output_folder)
+            if not slice_video_file(video_path, clips, mode=slice_mode, ledger=slice_ledger):
+                raise RuntimeError(f"Could not open video {video_path}")
+    return manifest
+
+
+def run_job(job, stages, slice_mode):
+    # all prints of one job go to its own log file; failures are reported, never raised
+    log_file = os.path.join(log_path, f"{job_id(job)}.log")
+    t0 = time.perf_counter()
+    status, error, manifest = 'ok', None, []
+    with open(log_file, 'w') as log, contextlib.redirect_stdout(log), contextlib.redirect_stderr(log), \
+            metrics.span('job', job=job_id(job), stages=list(stages)) as sp:
+        print(f"[JOB] {job_id(job)} sheet={job['sheet']} offset={job['offset']} stages={','.join(stages)}")
+        try:
+            manifest = run_stages(job, stages, slice_mode)
+        except Exception as e:
+            status, error = 'failed', f"{type(e).__name__}: {e}"
+            traceback.print_exc()
+        sp['status'] = status
+        print(f"[JOB] {status} in {time.perf_counter() - t0:.1f}s")
+    return {'job': job_id(job), 'session': job['session'], 'status': status,
+            'seconds': time.perf_counter() - t0, 'error': error, 'log': log_file, 'manifest': manifest}
+
+
+def init_worker():
+    # one OpenCV thread per process: parallelism comes from the pool
+    cv2.setNumThreads(1)
+    metrics.init_process('batch_slice.worker')
+
+
+def run_batch(jobs, stages=stages, workers=num_workers, slice_mode='stream', skipped=()):
+    os.makedirs(log_path, exist_ok=True)
+    results = []
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        futures = {pool.submit(run_job, job, stages, slice_mode): job for job in jobs}
+        for i, future in enumerate(as_completed(futures), start=1):
+            try:
+                result = future.result()
+            except Exception as e:  # worker process died
+                result = {'job': job_id(futures[future]), 'session': futures[future]['session'],
+                          'status': 'failed', 'seconds': 0.0, 'error': f"{type(e).__name__}: {e}",
+                          'log': None, 'manifest': []}
+            results.append(result)
+            print(f"[{i}/{len(jobs)}] {result['status']:6s} {result['job']} ({result['seconds']:.1f}s)")
+
+    # --- One manifest per session, written here so parallel jobs never race on the file ---
+    if slice_format == 'manifest':
+        for session in sorted({r['session'] for r in results}):
+            entries = [e for r in results if r['session'] == session for e in r['manifest']]
+            if entries:
+                manifest_path = os.path.join(output_path, 'csv', f"{session}_manifest.jsonl")
+                write_manifest(manifest_path, entries)
+                print(f"Manifest saved: {manifest_path} ({len(entries)} slices)")
+
+    # --- Summary ---
+    failed = [r for r in results if r['status'] != 'ok']
+    print(f"\nFinished {len(results)} jobs in {time.perf_counter() - t0:.1f}s "
+          f"with {workers} workers: {len(results) - len(failed)} ok, {len(failed)} failed")
+    for r in sorted(failed, key=lambda r: r['job']):
+        print(f"  FAILED {r['job']}: {r['error']} (log: {r['log']})")
+    if skipped:
+        print(f"{len(skipped)} offset rows skipped before the run (no job built):")
+        for session, video_name, reason in skipped:
+            print(f"  SKIPPED {session} {video_name}: {reason}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run extraction and slicing for every session, sheet and camera angle.")
+    parser.add_argument('--workers', type=int, default=num_workers)
+    parser.add_argument('--stages', nargs='+', choices=['extract', 'csv', 'video'], default=list(stages))
+    parser.add_argument('--sessions', nargs='+', help="session codes to run, e.g. 01 13 (default: all)")
+    parser.add_argument('--angles', nargs='+', choices=list(ANGLES), default=list(ANGLES))
+    parser.add_argument('--slice-mode', choices=['stream', 'seek', 'smartcut'], default='stream')
+    args = parser.parse_args()
+
+    metrics.init_process('batch_slice')
+    skipped = []
+    jobs = build_jobs(excel_folder, offset_excel_path, sessions=args.sessions, angles=args.angles, skipped=skipped)
+    print(f"Built {len(jobs)} jobs, skipped {len(skipped)} offset rows")
+    run_batch(jobs, stages=args.stages, workers=args.workers, slice_mode=args.slice_mode, skipped=skipped)
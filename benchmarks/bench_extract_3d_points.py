@@ -0,0 +1,76 @@
+import argparse
+import filecmp
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.fixtures import write_synthetic_optitrack_csv
+from utils.extract_24_keypoint_from_csv import TARGET_JOINTS_ORDERED, extract_3d_points_from_csv
+
+
+def extract_3d_points_legacy(input_path, output_path, total_frames=-1, skiprows=1, offset=0):
+    # 逐帧 iterrows 的旧实现，仅用于对比速度和输出
+    df = pd.read_csv(input_path, skiprows=skiprows, low_memory=False)
+    type_list = list(df.iloc[0].index)
+    header_row = df.iloc[0]
+    start = 4 + offset if offset < 0 else 4
+    end = start + total_frames if total_frames > 0 else len(df)
+    df = df.iloc[start:end].reset_index(drop=True)
+
+    selected_columns = []
+    for joint_id in range(24):
+        joint_defs = TARGET_JOINTS_ORDERED[joint_id]
+        found = [[i for i, val in enumerate(header_row)
+                  if str(val)[13:] == name and type_list[i].startswith(kind)][-3:]
+                 for name, kind in joint_defs]
+        selected_columns.append(tuple(found) if len(found) == 2 else found[0])
+
+    final_data = []
+    for _, row in df.iterrows():
+        frame_data = []
+        for cols in selected_columns:
+            if isinstance(cols, tuple):
+                vals_0 = pd.to_numeric(row.iloc[cols[0]], errors='coerce').values
+                vals_1 = pd.to_numeric(row.iloc[cols[1]], errors='coerce').values
+                frame_data.extend((vals_0 + vals_1) / 2)
+            else:
+                frame_data.extend(pd.to_numeric(row.iloc[cols], errors='coerce').values)
+        final_data.append(frame_data)
+
+    if offset < 0:
+        final_data = [[np.nan] * (24 * 3)] * abs(offset) + final_data
+    columns = [f"{i}_{axis}" for i in range(24) for axis in ['x', 'y', 'z']]
+    pd.DataFrame(final_data, columns=columns).to_csv(output_path, index=False)
+
+
+def time_call(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    fn(*args, **kwargs)
+    return time.perf_counter() - t0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark extract_3d_points_from_csv on a synthetic OptiTrack export.")
+    parser.add_argument("--frames", type=int, default=20000)
+    parser.add_argument("--extra-markers", type=int, default=50)
+    parser.add_argument("--offset", type=int, default=9)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        raw_csv = write_synthetic_optitrack_csv(os.path.join(tmp, "raw.csv"), args.frames, args.extra_markers)
+        new_out = os.path.join(tmp, "new_3d.csv")
+        old_out = os.path.join(tmp, "old_3d.csv")
+        total_frames = args.frames - abs(args.offset)
+
+        t_new = time_call(extract_3d_points_from_csv, raw_csv, new_out, total_frames=total_frames, offset=args.offset)
+        t_old = time_call(extract_3d_points_legacy, raw_csv, old_out, total_frames=total_frames, offset=args.offset)
+        identical = filecmp.cmp(new_out, old_out, shallow=False)
+
+    print(f"frames={args.frames} extra_markers={args.extra_markers} offset={args.offset}")
+    print(f"legacy iterrows : {t_old:8.2f} s")
+    print(f"vectorized      : {t_new:8.2f} s")
+    print(f"speedup         : {t_old / t_new:8.1f}x")
+    print(f"byte-identical  : {identical}")
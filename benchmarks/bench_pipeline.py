@@ -0,0 +1,234 @@
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+import pandas as pd
+
+from benchmarks.fixtures import (write_data_collection_workbook, write_offset_workbook,
+                                 write_synthetic_optitrack_csv, write_synthetic_video)
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, 'benchmarks', 'results')
+SESSION, CODE, GAME, SHEET, ANGLE = '25.1.1_01', '01', 'boss', 'Boss Fight', 'L'
+STAGES = ['extract', 'slice_csv', 'slice_video_stream', 'slice_video_seek', 'slice_video_smartcut',
+          'preview_full', 'preview_proxy']
+
+
+# --- 合成数据：原始 OptiTrack CSV、DataCollection / offset 工作簿、与 CSV 等长的 mp4 ---
+def build_fixture(root, frames, extra_markers, width, height, offset, reps):
+    video_name = f"{CODE}_{GAME}_{ANGLE}.mp4"
+    fx = {
+        'root': root,
+        'frames': frames,
+        'offset': offset,
+        'raw_csv': os.path.join(root, 'raw', f"{CODE}_{GAME}_raw.csv"),
+        'excel': os.path.join(root, 'excel', f"DataCollection_{CODE}.xlsx"),
+        'offset_excel': os.path.join(root, 'excel', 'offsets.xlsx'),
+        'video': os.path.join(root, 'raw_video', SESSION, video_name),
+        'video_name': video_name,
+        'track_name': f"{CODE}_{GAME}_{ANGLE}_3d.csv",
+        'track': os.path.join(root, 'extracted_csv', SESSION, f"{CODE}_{GAME}_{ANGLE}_3d.csv"),
+        'csv_out': os.path.join(root, 'output', 'csv'),
+        'video_out': os.path.join(root, 'output', 'videos'),
+        'preview_out': os.path.join(root, 'output', 'previews'),
+        'camera_json': os.path.join(REPO_ROOT, 'camera_data', 'extrinsics_left.json'),
+    }
+    for key in ('raw_csv', 'excel', 'video', 'track'):
+        os.makedirs(os.path.dirname(fx[key]), exist_ok=True)
+    write_synthetic_optitrack_csv(fx['raw_csv'], frames + abs(offset), extra_markers)
+    write_data_collection_workbook(fx['excel'], [SHEET], reps=reps, num_frames=frames)
+    write_offset_workbook(fx['offset_excel'], {SESSION: [(video_name, os.path.basename(fx['raw_csv']), offset)]})
+    write_synthetic_video(fx['video'], frames, width, height)
+    return fx
+
+
+def _cuts(fx):
+    from utils.annotations import load_cut_table
+    cuts = load_cut_table(fx['excel'])
+    return cuts[cuts['sheet'] == SHEET]
+
+
+# --- 各阶段：返回 (处理的帧数, 读入的字节数) ---
+def stage_extract(fx):
+    from utils.extract_24_keypoint_from_csv import extract_3d_points_from_csv
+    extract_3d_points_from_csv(fx['raw_csv'], fx['track'], total_frames=fx['frames'], offset=fx['offset'])
+    return fx['frames'], os.path.getsize(fx['raw_csv'])
+
+
+def stage_slice_csv(fx):
+    from slice_csv import slice_csv_based_on_offsets
+    from utils.annotations import load_offset_table
+    offsets = load_offset_table(fx['offset_excel'])
+    slice_csv_based_on_offsets(fx['track'], SHEET, fx['track_name'], fx['excel'], fx['csv_out'],
+                               offsets[offsets['session'] == SESSION], video_name=fx['video_name'])
+    cuts = _cuts(fx)
+    return int((cuts['end'] - cuts['start']).sum()), os.path.getsize(fx['track'])
+
+
+def stage_slice_video(fx, mode):
+    from slice_video import collect_clip_ranges, slice_video_file
+    output_folder = os.path.join(fx['video_out'], os.path.splitext(fx['video_name'])[0])
+    if os.path.isdir(output_folder):
+        shutil.rmtree(output_folder)
+    os.makedirs(output_folder)
+    cuts = _cuts(fx)
+    if not slice_video_file(fx['video'], collect_clip_ranges(cuts, fx['video_name'], output_folder), mode=mode):
+        raise RuntimeError(f"Could not open video {fx['video']}")
+    return int((cuts['end'] - cuts['start'] + 1).sum()), os.path.getsize(fx['video'])
+
+
+def stage_preview(fx, mode):
+    import preview_slicing
+    folder = os.path.splitext(fx['video_name'])[0]
+    video_folder = os.path.join(fx['video_out'], folder)
+    os.makedirs(fx['preview_out'], exist_ok=True)
+    camera = preview_slicing.load_camera_model(fx['camera_json'])
+    preview_slicing.run_previews(os.path.join(fx['csv_out'], folder), video_folder, camera, fx['preview_out'],
+                                 mode=mode)
+    clips = [os.path.join(video_folder, name) for name in os.listdir(video_folder) if name.endswith('.mp4')]
+    cuts = _cuts(fx)
+    return int((cuts['end'] - cuts['start']).sum()), sum(os.path.getsize(c) for c in clips)
+
+
+STAGE_FUNCTIONS = {
+    'extract': (stage_extract, ()),
+    'slice_csv': (stage_slice_csv, ()),
+    'slice_video_stream': (stage_slice_video, ('stream',)),
+    'slice_video_seek': (stage_slice_video, ('seek',)),
+    'slice_video_smartcut': (stage_slice_video, ('smartcut',)),
+    'preview_full': (stage_preview, ('full',)),
+    'preview_proxy': (stage_preview, ('proxy',)),
+}
+# 前置阶段：未选中时先运行（不计时），保证输入存在
+STAGE_REQUIRES = {
+    'slice_csv': ['extract'],
+    'preview_full': ['extract', 'slice_csv', 'slice_video_stream'],
+    'preview_proxy': ['extract', 'slice_csv', 'slice_video_stream'],
+}
+
+
+def peak_rss_mb():
+    # Linux: VmHWM starts fresh with the new process image; ru_maxrss would carry over the parent's peak from the fork
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024   # bytes on macOS, KB on Linux
+
+
+def run_stage(name, fx):
+    # 每个阶段在新进程中运行，进程的峰值内存即该阶段的峰值内存；阶段自身的输出写入 <root>/<name>.log
+    fn, args = STAGE_FUNCTIONS[name]
+    with open(os.path.join(fx['root'], f"{name}.log"), 'w') as log, contextlib.redirect_stdout(log):
+        t0 = time.perf_counter()
+        frames, nbytes = fn(fx, *args)
+        seconds = time.perf_counter() - t0
+    peak = peak_rss_mb()
+    return {
+        'stage': name,
+        'seconds': round(seconds, 4),
+        'frames': frames,
+        'frames_per_s': round(frames / seconds, 1) if seconds > 0 else None,
+        'input_mb': round(nbytes / (1 << 20), 2),
+        'mb_per_s': round(nbytes / (1 << 20) / seconds, 2) if seconds > 0 else None,
+        'peak_rss_mb': round(peak, 1) if peak is not None else None,
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(), 'platform': platform.platform(),
+            'cpu_count': os.cpu_count(), 'numpy': np.__version__, 'pandas': pd.__version__,
+            'opencv': cv2.__version__, 'ffmpeg': shutil.which('ffmpeg') is not None}
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {s['stage']: s for s in json.load(f)['stages']}
+    print(f"\nvs. {baseline_path}:")
+    for s in results['stages']:
+        old = baseline.get(s['stage'])
+        if old and s['seconds'] and old['seconds']:
+            print(f"  {s['stage']:22s} {old['seconds']:8.2f}s → {s['seconds']:8.2f}s "
+                  f"({old['seconds'] / s['seconds']:.2f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time every pipeline stage on synthetic OptiTrack / Excel / video fixtures.")
+    parser.add_argument("--frames", type=int, default=3000)
+    parser.add_argument("--extra-markers", type=int, default=50)
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=360)
+    parser.add_argument("--offset", type=int, default=9)
+    parser.add_argument("--reps", type=int, default=3)
+    parser.add_argument("--stages", nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument("--output", help="result JSON (default: benchmarks/results/bench_<time>.json)")
+    parser.add_argument("--baseline", help="earlier result JSON to compare against")
+    parser.add_argument("--keep", help="build the fixtures in this folder and keep them")
+    args = parser.parse_args()
+
+    stages = [s for s in STAGES if s in args.stages]
+    if 'slice_video_smartcut' in stages and shutil.which('ffmpeg') is None:
+        print("[WARN] ffmpeg not found, skipping slice_video_smartcut")
+        stages.remove('slice_video_smartcut')
+
+    with contextlib.ExitStack() as stack:
+        root = args.keep or stack.enter_context(tempfile.TemporaryDirectory())
+        os.makedirs(root, exist_ok=True)
+        os.environ['DASE_CACHE_DIR'] = os.path.join(root, 'cache')   # 不污染真实缓存；子进程继承
+
+        t0 = time.perf_counter()
+        fx = build_fixture(root, args.frames, args.extra_markers, args.width, args.height, args.offset, args.reps)
+        print(f"fixtures: {args.frames} frames, {args.extra_markers} extra markers, {args.width}×{args.height} "
+              f"video in {time.perf_counter() - t0:.1f}s")
+
+        results = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'environment': environment(),
+                   'params': {k: v for k, v in vars(args).items() if k not in ('output', 'baseline', 'keep')},
+                   'stages': []}
+        prepared = set()
+        for name in stages:
+            for required in STAGE_REQUIRES.get(name, []):
+                if required not in stages and required not in prepared:
+                    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+                        pool.submit(run_stage, required, fx).result()
+                    prepared.add(required)
+                    print(f"prepared: {required}")
+
+        print(f"{'stage':22s} {'seconds':>8s} {'frames/s':>10s} {'MB/s':>8s} {'peak MB':>8s}")
+        for name in stages:
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+                s = pool.submit(run_stage, name, fx).result()
+            results['stages'].append(s)
+            print(f"{name:22s} {s['seconds']:8.2f} {s['frames_per_s'] or 0:10.1f} {s['mb_per_s'] or 0:8.2f} "
+                  f"{s['peak_rss_mb'] or 0:8.1f}")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"bench_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"results saved: {output}")
+    if args.baseline:
+        compare(results, args.baseline)
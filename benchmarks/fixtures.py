@@ -0,0 +1,93 @@
+import cv2
+import numpy as np
+import pandas as pd
+
+from utils.extract_24_keypoint_from_csv import TARGET_JOINTS_ORDERED
+
+SKELETON_PREFIX = "Skeleton_001:"   # 13 个字符，与 str(val)[13:] 对应
+
+
+def write_synthetic_optitrack_csv(path, num_frames=5000, extra_markers=0, fps=120.0,
+                                  occlusion_ratio=0.01, seed=0):
+    # 生成与 Motive 导出格式一致的原始 CSV：元数据行、空行、Type/Name/ID/Position/Frame 五行表头
+    rng = np.random.default_rng(seed)
+
+    columns = []   # (type, name, id, group, axis)
+    bone_names = sorted({name for defs in TARGET_JOINTS_ORDERED.values()
+                         for name, kind in defs if kind == 'Bone'})
+    marker_names = sorted({name for defs in TARGET_JOINTS_ORDERED.values()
+                           for name, kind in defs if kind == 'Bone Marker'})
+    for bone_id, name in enumerate(bone_names, start=1):
+        for axis in ['X', 'Y', 'Z', 'W']:
+            columns.append(('Bone', SKELETON_PREFIX + name, bone_id, 'Rotation', axis))
+        for axis in ['X', 'Y', 'Z']:
+            columns.append(('Bone', SKELETON_PREFIX + name, bone_id, 'Position', axis))
+    for marker_id, name in enumerate(marker_names, start=1):
+        for axis in ['X', 'Y', 'Z']:
+            columns.append(('Bone Marker', SKELETON_PREFIX + name, f"{marker_id:X}", 'Position', axis))
+    for i in range(extra_markers):
+        for axis in ['X', 'Y', 'Z']:
+            columns.append(('Marker', f"Unlabeled {1000 + i}", f"{1000 + i:X}", 'Position', axis))
+
+    values = rng.normal(0.0, 0.5, size=(num_frames, len(columns)))
+    text = np.char.mod('%.6f', values)
+    text[rng.random(values.shape) < occlusion_ratio] = ''
+
+    with open(path, 'w', newline='') as f:
+        f.write(f"Format Version,1.23,Take Name,synthetic,Capture Frame Rate,{fps:.6f},"
+                f"Export Frame Rate,{fps:.6f},Total Frames in Take,{num_frames}\n")
+        f.write("\n")
+        f.write(",Type," + ",".join(c[0] for c in columns) + "\n")
+        f.write(",Name," + ",".join(c[1] for c in columns) + "\n")
+        f.write(",ID," + ",".join(str(c[2]) for c in columns) + "\n")
+        f.write(",," + ",".join(c[3] for c in columns) + "\n")
+        f.write("Frame,Time (Seconds)," + ",".join(c[4] for c in columns) + "\n")
+        for frame_idx in range(num_frames):
+            f.write(f"{frame_idx},{frame_idx / fps:.6f}," + ",".join(text[frame_idx]) + "\n")
+    return path
+
+
+def write_data_collection_workbook(path, sheets, actions=('Walking', 'Running', 'Jumping', 'Bending down'),
+                                   reps=3, num_frames=3000, seed=0):
+    # DataCollection_XX.xlsx：每个 sheet 一行一个动作，Repetition k Start / End 两列一组，帧号均匀分布在视频内
+    rng = np.random.default_rng(seed)
+    slot = num_frames // (len(actions) * reps)
+    with pd.ExcelWriter(path, engine='openpyxl') as writer:
+        for sheet in sheets:
+            table = {'Action': list(actions)}
+            for rep in range(1, reps + 1):
+                starts, ends = [], []
+                for row in range(len(actions)):
+                    begin = (row * reps + rep - 1) * slot
+                    length = int(rng.integers(slot // 2, slot - 1))
+                    starts.append(begin)
+                    ends.append(begin + length)
+                table[f"Repetition {rep} Start"] = starts
+                table[f"Repetition {rep} End"] = ends
+            pd.DataFrame(table).to_excel(writer, sheet_name=sheet, index=False)
+    return path
+
+
+def write_offset_workbook(path, sessions):
+    # sessions: {session: [(video_name, csv_name, offset)]}，与 new_csv_offset.xlsx 一致，每个 session 一个 sheet
+    with pd.ExcelWriter(path, engine='openpyxl') as writer:
+        for session, rows in sessions.items():
+            pd.DataFrame(rows, columns=['video_name', 'csv_name', 'offset']).to_excel(
+                writer, sheet_name=session, index=False)
+    return path
+
+
+def write_synthetic_video(path, num_frames=3000, width=640, height=360, fps=30.0, seed=0):
+    # 小尺寸 mp4v 视频：平移的噪声纹理 + 帧号，既有运动又能肉眼核对帧
+    rng = np.random.default_rng(seed)
+    texture = rng.integers(0, 256, size=(height, width * 2, 3), dtype=np.uint8)
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    try:
+        for i in range(num_frames):
+            x = (i * 4) % width
+            frame = np.ascontiguousarray(texture[:, x:x + width])
+            cv2.putText(frame, str(i), (10, 40), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (255, 255, 255), 2)
+            out.write(frame)
+    finally:
+        out.release()
+    return path
@@ -0,0 +1,110 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+
+from utils import metrics
+from utils.annotations import load_offset_table, write_offset_columns
+from utils.extract_24_keypoint_from_csv import load_joint_track
+from utils.frame_index import load_frame_index
+from utils.offset_estimate import MAX_LAG, estimate_offset, track_motion_signal, video_motion_energy
+from utils.projection import CAMERA_FILES, load_camera, projection_matrix
+from utils.resample import resample_track
+from utils.sessions import ANGLES, parse_video_name
+
+# --- CONFIGURATION ---
+offset_excel_path = '/data/sda1/cv_slice_data/new_csv_offset.xlsx'    # suggestions are written back here
+raw_video_base_path = '/data/sda1/mocap_data/raw_video'               # {session}/{code}_{game}_{angle}.mp4
+raw_csv_base_path = '/data/sda1/mocap_data/smoothed'                  # raw OptiTrack exports
+camera_data_path = './camera_data'                                    # extrinsics_left.json / extrinsics_middle.json
+max_lag = MAX_LAG                                                     # search window, in track rows
+resample = None        # None: mocap row i = video frame i (as in extraction); 'nearest' / 'linear': align by timestamps
+num_workers = os.cpu_count()
+
+
+# --- Suggest the offset of one video: video motion energy vs. (projected) joint speed ---
+def estimate_video_offset(video_path, raw_csv_path, camera_json=None, max_lag=max_lag, resample=resample):
+    data, times = load_joint_track(raw_csv_path)
+    if resample:
+        data = resample_track(data, times, load_frame_index(video_path)['times'], method=resample)
+    proj = projection_matrix(*load_camera(camera_json)) if camera_json else None
+    video_signal = video_motion_energy(video_path)
+    track_signal = track_motion_signal(data, proj)
+    return estimate_offset(video_signal, track_signal, max_lag=max_lag)
+
+
+def estimate_job(row):
+    video_path = os.path.join(raw_video_base_path, row['session'], row['video_name'])
+    raw_csv_path = os.path.join(raw_csv_base_path, row['csv_name'])
+    camera_file = CAMERA_FILES.get(row['angle'])
+    camera_json = os.path.join(camera_data_path, camera_file) if camera_file else None
+    t0 = time.perf_counter()
+    try:
+        offset, confidence, margin = estimate_video_offset(video_path, raw_csv_path, camera_json)
+        error = None
+    except Exception as e:
+        offset, confidence, margin, error = None, 0.0, 0.0, f"{type(e).__name__}: {e}"
+    return dict(row, suggested_offset=offset, confidence=round(confidence, 3), margin=round(margin, 3),
+                error=error, seconds=time.perf_counter() - t0)
+
+
+def init_worker():
+    # one OpenCV thread per process: parallelism comes from the pool
+    cv2.setNumThreads(1)
+    metrics.init_process('estimate_offsets.worker')
+
+
+def estimate_all(offset_excel_path, sessions=None, angles=ANGLES, workers=num_workers, write=True):
+    rows = []
+    for row in load_offset_table(offset_excel_path).itertuples(index=False):
+        try:
+            code, _, angle = parse_video_name(row.video_name)
+        except ValueError as e:
+            print(f"[WARN] {row.session}: {e}")
+            continue
+        if (sessions and code not in sessions) or angle not in angles:
+            continue
+        rows.append({'session': row.session, 'video_name': row.video_name, 'csv_name': row.csv_name,
+                     'angle': angle, 'offset': int(row.offset)})
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        futures = [pool.submit(estimate_job, row) for row in rows]
+        for i, future in enumerate(as_completed(futures), start=1):
+            r = future.result()
+            results.append(r)
+            status = (f"suggested {r['suggested_offset']} (current {r['offset']}), "
+                      f"confidence {r['confidence']:.2f}, margin {r['margin']:.2f}") if r['error'] is None \
+                else f"FAILED {r['error']}"
+            print(f"[{i}/{len(rows)}] {r['session']} {r['video_name']}: {status} ({r['seconds']:.1f}s)")
+
+    # --- Write suggested_offset / offset_confidence / offset_margin next to the hand-made offsets ---
+    if write:
+        values = {}
+        for r in results:
+            if r['error'] is None and r['suggested_offset'] is not None:
+                values.setdefault(r['session'], {})[r['video_name']] = {
+                    'suggested_offset': r['suggested_offset'],
+                    'offset_confidence': r['confidence'],
+                    'offset_margin': r['margin'],
+                }
+        if values:
+            write_offset_columns(offset_excel_path, values)
+            print(f"Suggestions written to {offset_excel_path} "
+                  f"({sum(len(v) for v in values.values())} videos)")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Estimate mocap/video offsets by cross-correlating motion signals.")
+    parser.add_argument('--workers', type=int, default=num_workers)
+    parser.add_argument('--sessions', nargs='+', help="session codes to run, e.g. 01 13 (default: all)")
+    parser.add_argument('--angles', nargs='+', choices=list(ANGLES), default=list(ANGLES))
+    parser.add_argument('--dry-run', action='store_true', help="print suggestions without touching the workbook")
+    args = parser.parse_args()
+
+    metrics.init_process('estimate_offsets')
+    estimate_all(offset_excel_path, sessions=args.sessions, angles=args.angles, workers=args.workers,
+                 write=not args.dry_run)
@@ -0,0 +1,126 @@
+import argparse
+import glob
+import json
+import os
+import random
+import re
+
+from utils import metrics
+from utils.ledger import atomic_output
+from utils.manifest import load_slice, read_manifest
+from utils.sessions import parse_slice_name
+from utils.shards import INDEX_SUFFIX, SHARD_SIZE, ShardWriter, encode_member, index_path
+from utils.track_io import load_track
+
+# --- CONFIGURATION ---
+csv_root = '/data/sda1/cv_slice_data/output/csv'          # {code}_{game}_{angle}/ slice folders and/or *_manifest.jsonl
+video_root = '/data/sda1/cv_slice_data/output/videos'     # {code}_{game}_{angle}/ clip folders
+dataset_path = '/data/sda1/cv_slice_data/output/dataset'  # shards + per-shard .idx.json + dataset.json
+shard_prefix = 'mocap'
+shard_size = SHARD_SIZE    # bytes per shard
+shuffle_seed = 0           # records are shuffled across shards once at pack time; None keeps name order
+include_video = True       # False: keypoints + metadata only
+
+CLIP_ROW_REP = re.compile(r"_row([0-9]+)_rep([0-9]+)\.mp4$")
+LOAD_SPANS = {'csv': 'csv_parse', 'npy': 'npy_load', 'manifest': 'manifest_load'}   # metrics span per slice source
+
+
+# --- One record per slice: keypoints (slice file or manifest entry) + the clip of the same row/rep ---
+def collect_records(csv_root, video_root, include_video=True):
+    records = {}   # (folder, row, rep) -> record
+
+    def add(folder, name, load, source, fmt):
+        try:
+            meta = parse_slice_name(name)
+        except ValueError as e:
+            print(f"[WARN] {e}, skipping")
+            return
+        key = (folder, meta['row'], meta['rep'])
+        if key in records:
+            print(f"[WARN] duplicate slice for {folder} row{meta['row']}_rep{meta['rep']}: {source}, skipping")
+            return
+        records[key] = {'key': os.path.splitext(name)[0].replace('.', '-'), 'meta': dict(meta, source=source),
+                        'load': load, 'format': fmt, 'video': None}
+
+    for name in sorted(os.listdir(csv_root)):
+        path = os.path.join(csv_root, name)
+        if os.path.isdir(path):
+            for slice_name in sorted(os.listdir(path)):
+                if slice_name.lower().endswith(('.csv', '.npy')):
+                    slice_path = os.path.join(path, slice_name)
+                    add(name, slice_name, lambda p=slice_path: load_track(p, mmap=False), slice_path,
+                        os.path.splitext(slice_name)[1][1:].lower())
+        elif name.endswith('_manifest.jsonl'):
+            for entry in read_manifest(path):
+                folder = os.path.splitext(os.path.basename(entry['video']))[0]
+                add(folder, entry['name'], lambda e=entry: load_slice(e), entry['source'], 'manifest')
+
+    if include_video:
+        clips = {}   # folder -> {(row, rep): clip path}
+        for (folder, row, rep), record in records.items():
+            if folder not in clips:
+                clips[folder] = {}
+                video_folder = os.path.join(video_root, folder)
+                for clip in sorted(os.listdir(video_folder)) if os.path.isdir(video_folder) else []:
+                    m = CLIP_ROW_REP.search(clip)
+                    if m:
+                        clips[folder][(int(m.group(1)), int(m.group(2)))] = os.path.join(video_folder, clip)
+            record['video'] = clips[folder].get((row, rep))
+            if record['video'] is None:
+                print(f"[WARN] no clip for {folder} row{row}_rep{rep}, packing keypoints only")
+    return list(records.values())
+
+
+def pack_dataset(records, dataset_path, prefix='mocap', max_size=SHARD_SIZE, seed=0):
+    if seed is not None:
+        random.Random(seed).shuffle(records)
+
+    with ShardWriter(dataset_path, prefix=prefix, max_size=max_size) as writer:
+        for i, record in enumerate(records, start=1):
+            with metrics.span(LOAD_SPANS[record['format']], file=os.path.basename(record['meta']['source'])):
+                points = record['load']()
+            members = {'npy': encode_member('npy', points)}
+            if record['video']:
+                members['mp4'] = record['video']
+            with metrics.span('write', format='tar', key=record['key']):
+                writer.write(record['key'], members, meta=dict(record['meta'], frames=len(points),
+                                                                video=record['video']))
+            metrics.count('records_packed')
+            if i % 500 == 0 or i == len(records):
+                print(f"[{i}/{len(records)}] packed, {len(writer.shards) + 1} shard(s)")
+    shards = writer.shards
+
+    # shards of an earlier, larger run would otherwise be picked up by readers globbing the folder
+    current = {path for path, _, _ in shards}
+    for stale in glob.glob(os.path.join(glob.escape(dataset_path), f"{glob.escape(prefix)}-*.tar")):
+        if stale not in current:
+            os.remove(stale)
+            if os.path.exists(index_path(stale)):
+                os.remove(index_path(stale))
+            print(f"Removed stale shard: {stale}")
+
+    summary = {
+        'shards': [{'path': os.path.basename(p), 'index': os.path.basename(p) + INDEX_SUFFIX,
+                    'records': n, 'bytes': size} for p, n, size in shards],
+        'records': sum(n for _, n, _ in shards),
+        'bytes': sum(size for _, _, size in shards),
+        'seed': seed,
+    }
+    with atomic_output(os.path.join(dataset_path, 'dataset.json')) as tmp_path, open(tmp_path, 'w') as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pack sliced keypoints and clips into tar shards with an index.")
+    parser.add_argument('--output', default=dataset_path)
+    parser.add_argument('--shard-size', type=int, default=shard_size // (1 << 20), help="MB per shard")
+    parser.add_argument('--seed', type=int, default=shuffle_seed)
+    parser.add_argument('--no-video', action='store_true', help="keypoints and metadata only")
+    args = parser.parse_args()
+
+    metrics.init_process('pack_dataset')
+    records = collect_records(csv_root, video_root, include_video=include_video and not args.no_video)
+    summary = pack_dataset(records, args.output, prefix=shard_prefix, max_size=args.shard_size << 20, seed=args.seed)
+    print(f"Packed {summary['records']} records into {len(summary['shards'])} shard(s), "
+          f"{summary['bytes'] / (1 << 20):.1f} MB → {args.output}")
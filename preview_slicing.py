@@ -1,72 +1,132 @@
-import os, json
+import os
 import cv2
 import numpy as np
 import pandas as pd
 import re
+from utils import metrics
+from utils.projection import (CAMERA_FILES, load_camera, load_dist_coeffs, project_points,
+                              project_points_distorted, projection_matrix)
+from utils.sessions import ANGLES
+from utils.track_io import load_track
+from utils.video_pipeline import format_stage_report, run_pipeline
 
 # --- CONFIGURATION: point these to your folders + camera JSON ---
 csv_folder    = "/data/sda1/cv_slice_data/output/csv/01_boss_L"
 video_folder  = "/data/sda1/cv_slice_data/output/videos/01_boss_L"   # now a folder of clip_*.mp4 files
 camera_json   = "/data/sda1/cv_slice_data/camera_data/extrinsics_left.json"
 output_folder = "/data/sda1/cv_slice_data/output/previews"
+queue_depth   = 8      # frames buffered between the decode / draw / encode threads
+use_distortion = True  # project through the calibrated lens model (dist_coeffs) instead of the pinhole K·[R|t]
 
-os.makedirs(output_folder, exist_ok=True)
+# quick QA: 'full' = every frame at source resolution; 'proxy' = every Nth frame, downscaled, small mp4;
+# 'contact' = one JPEG grid of evenly spaced frames per slice
+preview_mode  = 'full'
+proxy_stride  = 5      # proxy: render every Nth frame (played back at fps / N, so the duration is kept)
+proxy_width   = 480    # proxy: output width in pixels
+contact_tiles = 16     # contact: frames sampled across the slice
+contact_columns = 4
+contact_width = 320    # contact: width of one tile
+
+# mosaic mode: L/C/R clips of the same rowN_repM side by side in one preview
+mosaic        = False
+mosaic_video  = "01_boss"                                   # {code}_{game}; folders are {mosaic_video}_{angle}
+csv_root      = "/data/sda1/cv_slice_data/output/csv"
+video_root    = "/data/sda1/cv_slice_data/output/videos"
+camera_folder = "/data/sda1/cv_slice_data/camera_data"       # extrinsics_left.json / extrinsics_middle.json
+mosaic_height = 540    # every panel is scaled to this height
+
+PREVIEW_OUTPUTS = {'full': ('preview', 'mp4'), 'proxy': ('proxy', 'mp4'), 'contact': ('contact', 'jpg')}
+SLICE_NAME = re.compile(r"([^_]+)_([^_]+)_([^_]+)_(.+?)_row([0-9]+)_rep([0-9]+)\.(?:csv|npy)$")
 
-# load camera intrinsics+extrinsics
-with open(camera_json, 'r') as f:
-    cam = json.load(f)
-K   = np.array(cam['camera_matrix'])       # 3×3
-P4  = np.array(cam['best_extrinsic'])      # 3×4
-proj = K.dot(P4)                           # full 3×4 projection
-print(f"[INFO] Loaded camera, proj matrix shape = {proj.shape}")
 
 # build a map of (row,rep) → video file using new clip_ naming
-video_map = {}
-for vid in sorted(os.listdir(video_folder)):
-    if not vid.lower().endswith(".mp4"):
-        continue
-    # match any filename ending in _row{row}_rep{rep}.mp4
-    m = re.match(r".*_row([0-9]+)_rep([0-9]+)\.mp4$", vid)
-    if m:
-        key = (m.group(1), m.group(2))
-        video_map[key] = os.path.join(video_folder, vid)
-    else:
-        print(f"[WARN] skipping unrecognized video name: {vid}")
-
-for csv_name in sorted(os.listdir(csv_folder)):
-    if not csv_name.lower().endswith(".csv"):
-        continue
-
-    # parse slice CSV name: slice_{code}_{name}_{suffix}_{action}_row{row}_rep{rep}.csv
-    m = re.match(
-        r"([^_]+)_([^_]+)_([^_]+)_(.+?)_row([0-9]+)_rep([0-9]+)\.csv$",
-        csv_name
-    )
-    if not m:
-        print(f"[WARN] skipping unrecognized csv name: {csv_name}")
-        continue
-    code, vid_name, suffix, action, row_i, rep = m.groups()
-    csv_path = os.path.join(csv_folder, csv_name)
-
-    # lookup matching video by (row,rep)
-    video_path = video_map.get((row_i, rep))
-    if not video_path:
-        print(f"[WARN] no clip for row{row_i}_rep{rep}, skipping")
-        continue
-
-    # build preview filename with code, video name, suffix, action, row & rep
-    action_safe = action.replace(' ', '-')
-    preview_name = (
-        f"preview_{code}_{vid_name}_{suffix}_"
-        f"{action_safe}_row{row_i}_rep{rep}.mp4"
-    )
-    out_path = os.path.join(output_folder, preview_name)
-
-    print(f"[INFO] Processing pair: {csv_name} ⟷ {os.path.basename(video_path)}")
-
-    # load CSV slice
+def build_video_map(video_folder):
+    video_map = {}
+    for vid in sorted(os.listdir(video_folder)):
+        if not vid.lower().endswith(".mp4"):
+            continue
+        # match any filename ending in _row{row}_rep{rep}.mp4
+        m = re.match(r".*_row([0-9]+)_rep([0-9]+)\.mp4$", vid)
+        if m:
+            key = (m.group(1), m.group(2))
+            video_map[key] = os.path.join(video_folder, vid)
+        else:
+            print(f"[WARN] skipping unrecognized video name: {vid}")
+    return video_map
+
+
+# load a slice as a (frames, joints, 3) array
+def load_slice_points(csv_path):
+    # binary .npy slice, see utils/track_io.py
+    if csv_path.lower().endswith(".npy"):
+        return np.asarray(load_track(csv_path), dtype=np.float64)
+
     df3d = pd.read_csv(csv_path)
-    print(f"       CSV rows = {len(df3d)}, columns = {len(df3d.columns)}")
+    # detect joint columns like '0_x','0_y','0_z',…
+    joint_cols = [c for c in df3d.columns if "_" in c]
+    if joint_cols:
+        jids = sorted({c.split("_")[0] for c in joint_cols},
+                      key=lambda s: int(s))
+        cols = [f"{jid}_{axis}" for jid in jids for axis in "xyz"]
+        values = df3d[cols].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+        return values.reshape(len(df3d), len(jids), 3)
+    # fallback single‐point case
+    df3d = df3d.rename(columns=lambda s: s.strip().lower())
+    values = df3d[['x', 'y', 'z']].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+    return values.reshape(len(df3d), 1, 3)
+
+
+# camera = (K, P4, dist); dist None means plain pinhole projection
+def load_camera_model(camera_json, use_distortion=True):
+    K, P4 = load_camera(camera_json)
+    return K, P4, load_dist_coeffs(camera_json) if use_distortion else None
+
+
+def project_slice(points, camera):
+    # all frames × joints in one batch
+    K, P4, dist = camera
+    if dist is None:
+        return project_points(points, projection_matrix(K, P4))
+    return project_points_distorted(points, K, P4, dist)
+
+
+def draw_overlay(img, uv, valid, i, num_frames, radius=5, font_scale=0.6):
+    if i < num_frames:
+        for u, v in uv[i][valid[i]]:
+            cv2.circle(img, (int(u), int(v)), radius, (0,0,255), -1)
+
+    # frame counter
+    cv2.putText(img, f"frame {i+1}/{num_frames}",
+                (10, img.shape[0]-10),
+                cv2.FONT_HERSHEY_SIMPLEX, font_scale, (255,255,255), 1 if font_scale < 0.5 else 2)
+    return img
+
+
+# read only the picked frames; the ones in between are grabbed (never converted to BGR)
+def read_frames(cap, picks):
+    picks = set(picks)
+    for i in range(max(picks, default=-1) + 1):
+        if i in picks:
+            ret, img = cap.read()
+        else:
+            ret, img = cap.grab(), None
+        if not ret:
+            print("       [WARN] video ended prematurely")
+            return
+        if img is not None:
+            yield i, img
+
+
+def scaled_size(W, H, width):
+    # never upscale; even sizes keep every encoder happy
+    scale = min(1.0, width / W)
+    return scale, (max(2, round(W * scale) // 2 * 2), max(2, round(H * scale) // 2 * 2))
+
+
+def render_preview(video_path, points, camera, out_path, queue_depth=8):
+    # project the whole slice at once; only the drawing stays per frame
+    uv, valid = project_slice(points, camera)
+    num_frames = len(points)
 
     # open video clip
     cap = cv2.VideoCapture(video_path)
@@ -77,46 +137,247 @@ for csv_name in sorted(os.listdir(csv_folder)):
     out = cv2.VideoWriter(out_path, fourcc, fps, (W, H))
     print(f"       Video opened: {W}×{H}@{fps:.1f}fps → writing {out_path}")
 
-    # project & write each frame
-    for i, row in df3d.iterrows():
-        ret, img = cap.read()
-        if not ret:
-            print("       [WARN] video ended prematurely")
-            break
-
-        # detect joint columns like '0_x','0_y','0_z',…
-        joint_cols = [c for c in df3d.columns if "_" in c]
-        if joint_cols:
-            jids = sorted({c.split("_")[0] for c in joint_cols},
-                          key=lambda s: int(s))
-            for jid in jids:
-                X3d = np.array([
-                    row[f"{jid}_x"],
-                    row[f"{jid}_y"],
-                    row[f"{jid}_z"],
-                    1.0
-                ])
-                x2d = proj.dot(X3d)
-                if not np.isfinite(x2d).all() or x2d[2] == 0:
-                    continue
-                u, v = int(x2d[0]/x2d[2]), int(x2d[1]/x2d[2])
-                cv2.circle(img, (u, v), 5, (0,0,255), -1)
-        else:
-            # fallback single‐point case
-            row = row.rename(lambda s: s.strip().lower())
-            X3d = np.array([row['x'], row['y'], row['z'], 1.0])
-            x2d = proj.dot(X3d)
-            if np.isfinite(x2d).all() and x2d[2] != 0:
-                u, v = int(x2d[0]/x2d[2]), int(x2d[1]/x2d[2])
-                cv2.circle(img, (u, v), 5, (0,0,255), -1)
+    # decode, draw and encode run as a bounded three-stage pipeline
+    def decode():
+        for i in range(num_frames):
+            ret, img = cap.read()
+            if not ret:
+                print("       [WARN] video ended prematurely")
+                return
+            yield i, img
 
-        # frame counter
-        cv2.putText(img, f"frame {i+1}/{len(df3d)}",
-                    (10, H-10),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255,255,255), 2)
+    def draw(item):
+        i, img = item
+        return draw_overlay(img, uv, valid, i, num_frames)
 
-        out.write(img)
+    stats = run_pipeline(decode(), draw, out.write, queue_depth=queue_depth, name='preview.full')
+    print(f"       [TIMING] {format_stage_report(stats)}")
 
     cap.release()
     out.release()
-    print(f"[OK] Saved preview: {out_path}\n")
\ No newline at end of file
+
+
+# --- Proxy: every `stride`-th frame, downscaled before drawing, for fast batch QA ---
+def render_proxy(video_path, points, camera, out_path, stride=5, width=480, queue_depth=8):
+    uv, valid = project_slice(points, camera)
+    num_frames = len(points)
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        print(f"       [WARN] could not open video {video_path}, skipping")
+        return
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    W   = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    H   = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    scale, size = scaled_size(W, H, width)
+    uv = uv * scale
+    out = cv2.VideoWriter(out_path, cv2.VideoWriter_fourcc(*'mp4v'), (fps or 30.0) / stride, size)
+    print(f"       Proxy: {W}×{H} → {size[0]}×{size[1]}, every {stride}th frame → writing {out_path}")
+
+    def draw(item):
+        i, img = item
+        img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+        return draw_overlay(img, uv, valid, i, num_frames, radius=2, font_scale=0.4)
+
+    try:
+        stats = run_pipeline(read_frames(cap, range(0, num_frames, stride)), draw, out.write, queue_depth=queue_depth,
+                             name='preview.proxy')
+        print(f"       [TIMING] {format_stage_report(stats)}")
+    finally:
+        cap.release()
+        out.release()
+
+
+# --- Contact sheet: `tiles` evenly spaced frames of the slice in one JPEG grid ---
+def render_contact_sheet(video_path, points, camera, out_path, tiles=16, columns=4, width=320):
+    uv, valid = project_slice(points, camera)
+    num_frames = len(points)
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        print(f"       [WARN] could not open video {video_path}, skipping")
+        return
+    W   = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    H   = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    scale, (w, h) = scaled_size(W, H, width)
+    uv = uv * scale
+    picks = np.unique(np.linspace(0, max(num_frames - 1, 0), tiles).round().astype(int)) if num_frames else []
+
+    rows = max(1, -(-len(picks) // columns))
+    sheet = np.zeros((rows * h, columns * w, 3), dtype=np.uint8)
+    filled = 0
+    try:
+        for k, (i, img) in enumerate(read_frames(cap, picks)):
+            img = cv2.resize(img, (w, h), interpolation=cv2.INTER_AREA)
+            r, c = divmod(k, columns)
+            sheet[r * h:(r + 1) * h, c * w:(c + 1) * w] = draw_overlay(img, uv, valid, i, num_frames,
+                                                                       radius=2, font_scale=0.4)
+            filled += 1
+    finally:
+        cap.release()
+    if not filled:
+        print(f"       [WARN] no frames decoded from {video_path}, skipping")
+        return
+    cv2.imwrite(out_path, sheet, [cv2.IMWRITE_JPEG_QUALITY, 85])
+    print(f"       Contact sheet: {filled}/{len(picks)} frames, {columns * w}×{rows * h} → {out_path}")
+
+
+# --- Mosaic: several angles of one repetition, decoded in lockstep and written by one encoder ---
+# panels: [(label, video_path or None, points or None, camera or None)]
+def render_mosaic(panels, out_path, height=540, queue_depth=8):
+    caps, sizes, overlays = [], [], []
+    fps = 0.0
+    num_frames = 0
+    for label, video_path, points, camera in panels:
+        cap = cv2.VideoCapture(video_path) if video_path else None
+        if cap is not None and cap.isOpened():
+            fps = fps or cap.get(cv2.CAP_PROP_FPS)
+            w, h = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            n = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        else:
+            cap, (w, h), n = None, (16, 9), 0
+        overlay = project_slice(points, camera) + (len(points),) if points is not None and camera is not None else None
+        num_frames = max(num_frames, len(points) if points is not None else n)
+        caps.append(cap)
+        sizes.append((max(1, round(w * height / h)), height))
+        overlays.append(overlay)
+
+    W = sum(w for w, _ in sizes)
+    out = cv2.VideoWriter(out_path, cv2.VideoWriter_fourcc(*'mp4v'), fps or 30.0, (W, height))
+    print(f"       Mosaic: {len(panels)} panels → {W}×{height}@{fps:.1f}fps → writing {out_path}")
+
+    def decode():
+        for i in range(num_frames):
+            imgs = []
+            for cap in caps:
+                ret, img = cap.read() if cap is not None else (False, None)
+                imgs.append(img if ret else None)
+            if all(img is None for img in imgs):
+                print("       [WARN] all clips ended prematurely")
+                return
+            yield i, imgs
+
+    def draw(item):
+        i, imgs = item
+        tiles = []
+        for (label, *_), img, overlay, size in zip(panels, imgs, overlays, sizes):
+            if img is None:  # missing angle or a clip that ended early
+                img = np.zeros((size[1], size[0], 3), dtype=np.uint8)
+            else:
+                if overlay is not None:
+                    uv, valid, n = overlay
+                    draw_overlay(img, uv, valid, i, n)
+                img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+            cv2.putText(img, label, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255,255,255), 2)
+            tiles.append(img)
+        return np.hstack(tiles)
+
+    try:
+        stats = run_pipeline(decode(), draw, out.write, queue_depth=queue_depth, name='preview.mosaic')
+        print(f"       [TIMING] {format_stage_report(stats)}")
+    finally:
+        for cap in caps:
+            if cap is not None:
+                cap.release()
+        out.release()
+
+
+def build_slice_map(csv_folder):
+    # (row, rep) → (slice path, name groups)
+    slice_map = {}
+    if not os.path.isdir(csv_folder):
+        return slice_map
+    for csv_name in sorted(os.listdir(csv_folder)):
+        m = SLICE_NAME.match(csv_name)
+        if m:
+            slice_map[(m.group(5), m.group(6))] = (os.path.join(csv_folder, csv_name), m.groups())
+    return slice_map
+
+
+def run_mosaic(video_prefix, csv_root, video_root, camera_folder, output_folder, height=540, queue_depth=8,
+               use_distortion=True):
+    slice_maps, video_maps, cameras = {}, {}, {}
+    for angle in ANGLES:
+        slice_maps[angle] = build_slice_map(os.path.join(csv_root, f"{video_prefix}_{angle}"))
+        vfolder = os.path.join(video_root, f"{video_prefix}_{angle}")
+        video_maps[angle] = build_video_map(vfolder) if os.path.isdir(vfolder) else {}
+        cam_file = CAMERA_FILES.get(angle)
+        cam_path = os.path.join(camera_folder, cam_file) if cam_file else None
+        cameras[angle] = load_camera_model(cam_path, use_distortion) if cam_path and os.path.exists(cam_path) else None
+
+    keys = sorted(set().union(*video_maps.values()), key=lambda k: (int(k[0]), int(k[1])))
+    for row_i, rep in keys:
+        panels, action = [], None
+        for angle in ANGLES:
+            video_path = video_maps[angle].get((row_i, rep))
+            slice_path, groups = slice_maps[angle].get((row_i, rep), (None, None))
+            points = load_slice_points(slice_path) if slice_path else None
+            action = action or (groups[3] if groups else None)
+            panels.append((angle, video_path, points, cameras[angle]))
+        action_safe = (action or 'unknown').replace(' ', '-')
+        out_path = os.path.join(output_folder, f"mosaic_{video_prefix}_{action_safe}_row{row_i}_rep{rep}.mp4")
+        print(f"[INFO] Mosaic row{row_i}_rep{rep}: " +
+              ", ".join(f"{a}={'clip' if v else '-'}/{'slice' if p is not None else '-'}" for a, v, p, _ in panels))
+        render_mosaic(panels, out_path, height=height, queue_depth=queue_depth)
+        print(f"[OK] Saved mosaic: {out_path}\n")
+
+
+def run_previews(csv_folder, video_folder, camera, output_folder, queue_depth=8, mode='full'):
+    if mode not in PREVIEW_OUTPUTS:
+        raise ValueError(f"Unknown preview mode '{mode}', expected one of {tuple(PREVIEW_OUTPUTS)}")
+    video_map = build_video_map(video_folder)
+
+    for csv_name in sorted(os.listdir(csv_folder)):
+        if not csv_name.lower().endswith((".csv", ".npy")):
+            continue
+
+        # parse slice CSV name: slice_{code}_{name}_{suffix}_{action}_row{row}_rep{rep}.csv
+        m = SLICE_NAME.match(csv_name)
+        if not m:
+            print(f"[WARN] skipping unrecognized csv name: {csv_name}")
+            continue
+        code, vid_name, suffix, action, row_i, rep = m.groups()
+        csv_path = os.path.join(csv_folder, csv_name)
+
+        # lookup matching video by (row,rep)
+        video_path = video_map.get((row_i, rep))
+        if not video_path:
+            print(f"[WARN] no clip for row{row_i}_rep{rep}, skipping")
+            continue
+
+        # build preview filename with code, video name, suffix, action, row & rep
+        action_safe = action.replace(' ', '-')
+        prefix, ext = PREVIEW_OUTPUTS[mode]
+        preview_name = (
+            f"{prefix}_{code}_{vid_name}_{suffix}_"
+            f"{action_safe}_row{row_i}_rep{rep}.{ext}"
+        )
+        out_path = os.path.join(output_folder, preview_name)
+
+        print(f"[INFO] Processing pair: {csv_name} ⟷ {os.path.basename(video_path)}")
+
+        # load CSV slice
+        points = load_slice_points(csv_path)
+        print(f"       CSV rows = {points.shape[0]}, joints = {points.shape[1]}")
+
+        if mode == 'proxy':
+            render_proxy(video_path, points, camera, out_path, stride=proxy_stride, width=proxy_width,
+                         queue_depth=queue_depth)
+        elif mode == 'contact':
+            render_contact_sheet(video_path, points, camera, out_path, tiles=contact_tiles,
+                                 columns=contact_columns, width=contact_width)
+        else:
+            render_preview(video_path, points, camera, out_path, queue_depth=queue_depth)
+        print(f"[OK] Saved preview: {out_path}\n")
+
+
+if __name__ == "__main__":
+    metrics.init_process('preview_slicing')
+    os.makedirs(output_folder, exist_ok=True)
+    if mosaic:
+        run_mosaic(mosaic_video, csv_root, video_root, camera_folder, output_folder,
+                   height=mosaic_height, queue_depth=queue_depth, use_distortion=use_distortion)
+    else:
+        camera = load_camera_model(camera_json, use_distortion)
+        print(f"[INFO] Loaded camera, distortion = {'on' if camera[2] is not None else 'off'}")
+        run_previews(csv_folder, video_folder, camera, output_folder, queue_depth=queue_depth, mode=preview_mode)
@@ -0,0 +1,179 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from utils import metrics
+from utils.annotations import load_cut_table, load_offset_table
+from utils.ledger import atomic_output
+from utils.manifest import read_manifest
+from utils.sessions import ANGLES, parse_slice_name, parse_video_name, session_code
+from utils.slice_quality import flag_report, iloc_bounds, slice_metrics
+from utils.track_io import load_track, load_track_meta
+
+# --- CONFIGURATION ---
+excel_folder = '/data/sda1/cv_slice_data/excel'                       # DataCollection_XX.xlsx files
+offset_excel_path = '/data/sda1/cv_slice_data/new_csv_offset.xlsx'    # one sheet per session, e.g. '25.1.17_13'
+extracted_csv_path = '/data/sda1/cv_slice_data/extracted_csv'         # {session}/{code}_{game}_{angle}_3d.csv
+csv_root = '/data/sda1/cv_slice_data/output/csv'                      # sliced csv/npy folders and *_manifest.jsonl
+report_path = '/data/sda1/cv_slice_data/output/qa/slice_quality.csv'
+source = 'tracks'      # 'tracks': extracted _3d tracks + cut table (no slicing needed); 'slices': the sliced files
+                       # ('slices' with .csv slices: no start/end is stored, so expected_frames / missing_frames
+                       # stay empty and a short slice cannot be flagged; use 'tracks', npy or manifest output for that)
+track_format = 'csv'   # extracted track format in 'tracks' mode
+num_workers = os.cpu_count()
+
+
+# --- 'tracks': every slice of one extracted track, straight from the cut table and offset ---
+def track_report(job):
+    video_stem = os.path.splitext(job['video_name'])[0]
+    track_path = os.path.join(extracted_csv_path, job['session'], f"{video_stem}_3d.{track_format}")
+    cuts = load_cut_table(job['excel_path'])
+    cuts = cuts[cuts['sheet'] == job['sheet']]
+    track = load_track(track_path)
+
+    # same rows as slice_csv: csv_data.iloc[start + offset:end + offset]
+    s = cuts['start'].to_numpy(dtype=np.int64) + int(job['offset'])
+    e = cuts['end'].to_numpy(dtype=np.int64) + int(job['offset'])
+    starts, stops = iloc_bounds(len(track), s, e)
+    report = slice_metrics(track, starts, stops, expected=cuts['end'] - cuts['start'])
+
+    vid_code, vid_name, vid_suffix = parse_video_name(job['video_name'])
+    actions = cuts['action'].astype(str).str.strip().str.replace(' ', '-').str.lower()
+    ids = pd.DataFrame({
+        'session': job['session'], 'video': job['video_name'],
+        'name': [f"{vid_code}_{vid_name}_{vid_suffix}_{a}_row{r}_rep{k}"
+                 for a, r, k in zip(actions, cuts['row'], cuts['rep'])],
+        'action': cuts['action'].to_numpy(), 'row': cuts['row'].to_numpy(), 'rep': cuts['rep'].to_numpy(),
+        'start': s, 'end': e,
+    })
+    return pd.concat([ids, report], axis=1)
+
+
+# --- 'slices': all slice files of one folder concatenated, so the metrics still run once per folder ---
+# .csv slices carry no start/end, so their expected_frames (and missing_frames) are NaN
+def folder_report(unit):
+    folder, session = unit
+    names = sorted(n for n in os.listdir(folder) if n.lower().endswith(('.csv', '.npy')))
+    tracks, ids, expected = [], [], []
+    for name in names:
+        path = os.path.join(folder, name)
+        try:
+            meta = parse_slice_name(name)
+        except ValueError as e:
+            print(f"[WARN] {e}, skipping")
+            continue
+        sidecar = load_track_meta(path) if name.lower().endswith('.npy') else {}
+        tracks.append(np.asarray(load_track(path), dtype=np.float64))
+        # float(): older sidecars stored numpy start/end as strings
+        start, end = float(sidecar.get('start', np.nan)), float(sidecar.get('end', np.nan))
+        expected.append(end - start)
+        ids.append({'session': session or meta['code'], 'video': f"{meta['code']}_{meta['game']}_{meta['angle']}.mp4",
+                    'name': os.path.splitext(name)[0], 'action': meta['action'], 'row': meta['row'],
+                    'rep': meta['rep'], 'start': start, 'end': end})
+    if not tracks:
+        return pd.DataFrame()
+    lengths = np.array([len(t) for t in tracks])
+    stops = np.cumsum(lengths)
+    report = slice_metrics(np.concatenate(tracks), stops - lengths, stops, expected=expected)
+    return pd.concat([pd.DataFrame(ids), report], axis=1)
+
+
+def manifest_report(manifest_path):
+    # one slice_metrics call per source track, with the manifest's [start, end) ranges
+    reports = []
+    entries = pd.DataFrame(read_manifest(manifest_path))
+    session = os.path.basename(manifest_path)[:-len('_manifest.jsonl')]
+    for source_path, group in entries.groupby('source', sort=False):
+        track = load_track(source_path)
+        starts, stops = iloc_bounds(len(track), group['start'], group['end'])
+        report = slice_metrics(track, starts, stops, expected=group['end'] - group['start'])
+        ids = group[['video', 'name', 'action', 'row', 'rep', 'start', 'end']].reset_index(drop=True)
+        ids.insert(0, 'session', session)
+        reports.append(pd.concat([ids, report], axis=1))
+    return pd.concat(reports, ignore_index=True) if reports else pd.DataFrame()
+
+
+def build_units(source, sessions=None, angles=ANGLES):
+    # (function, argument) pairs, one per track / folder / manifest
+    if source == 'tracks':
+        from batch_slice import build_jobs
+        return [(track_report, job) for job in build_jobs(excel_folder, offset_excel_path, sessions, angles)]
+    if source != 'slices':
+        raise ValueError(f"Unknown source '{source}', expected 'tracks' or 'slices'")
+    sessions_by_code = session_folders(offset_excel_path)
+    units = []
+    for name in sorted(os.listdir(csv_root)):
+        path = os.path.join(csv_root, name)
+        code = name.split('_', 1)[0]
+        if sessions and code not in sessions and not any(name.endswith(f"_{c}_manifest.jsonl") for c in sessions):
+            continue
+        if os.path.isdir(path):
+            if name.rsplit('_', 1)[-1] in angles:
+                units.append((folder_report, (path, sessions_by_code.get(code))))
+        elif name.endswith('_manifest.jsonl'):
+            units.append((manifest_report, path))
+    return units
+
+
+def session_folders(offset_excel_path):
+    # video code -> session folder ('13' -> '25.1.17_13'), so slice folders report the same session as the other modes
+    try:
+        offset_table = load_offset_table(offset_excel_path)
+    except Exception as e:
+        print(f"[WARN] cannot read {offset_excel_path} ({e}), reporting slice folders by video code")
+        return {}
+    return {session_code(session): session for session in offset_table['session'].unique()}
+
+
+def _run_unit(unit):
+    fn, arg = unit
+    try:
+        return fn(arg), None
+    except Exception as e:
+        label = arg.get('video_name') if isinstance(arg, dict) else arg[0] if isinstance(arg, tuple) else arg
+        return None, f"{fn.__name__}({label}): {type(e).__name__}: {e}"
+
+
+def run_report(source=source, sessions=None, angles=ANGLES, workers=num_workers, report_path=report_path):
+    t0 = time.perf_counter()
+    units = build_units(source, sessions, angles)
+    with ProcessPoolExecutor(max_workers=workers, initializer=metrics.init_process,
+                             initargs=('qa_slices.worker',)) as pool:
+        results = list(pool.map(_run_unit, units))
+    for _, error in results:
+        if error:
+            print(f"[WARN] {error}")
+    parts = [r for r, _ in results if r is not None and len(r)]
+    if not parts:
+        print("No slices found.")
+        return pd.DataFrame()
+
+    report = flag_report(pd.concat(parts, ignore_index=True))
+    os.makedirs(os.path.dirname(report_path) or '.', exist_ok=True)
+    with atomic_output(report_path) as tmp_path:
+        report.to_csv(tmp_path, index=False, float_format='%.4f')
+
+    flagged = report[report['num_flags'] > 0]
+    print(f"{len(report)} slices from {len(parts)} {'tracks' if source == 'tracks' else 'folders / manifests'} in {time.perf_counter() - t0:.1f}s, "
+          f"{len(flagged)} flagged → {report_path}")
+    for row in flagged.head(20).itertuples(index=False):
+        print(f"  {row.session} {row.name}: {row.flags}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch quality report over every slice, worst first.")
+    parser.add_argument('--source', choices=['tracks', 'slices'], default=source)
+    parser.add_argument('--workers', type=int, default=num_workers)
+    parser.add_argument('--sessions', nargs='+', help="session codes to run, e.g. 01 13 (default: all)")
+    parser.add_argument('--angles', nargs='+', choices=list(ANGLES), default=list(ANGLES))
+    parser.add_argument('--output', default=report_path)
+    args = parser.parse_args()
+
+    metrics.init_process('qa_slices')
+    run_report(args.source, sessions=args.sessions, angles=args.angles, workers=args.workers,
+               report_path=args.output)
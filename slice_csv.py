@@ -1,5 +1,11 @@
 import pandas as pd
 import os
+from utils import metrics
+from utils.annotations import load_cut_table, load_offset_table
+from utils.ledger import JobLedger, atomic_output
+from utils.manifest import manifest_entry, write_manifest
+from utils.sessions import build_sheet_csv_map, build_sheet_video_map, parse_video_name
+from utils.track_io import load_track, save_track, track_format, track_to_frame
 
 # --- CONFIGURATION ---
 video_code = '13'
@@ -10,90 +16,129 @@ excel_path = f"/data/sda1/cv_slice_data/excel/DataCollection_{video_code}.xlsx"
 offset_excel_path = '/data/sda1/cv_slice_data/new_csv_offset.xlsx'  # Path to the new Excel file with offsets
 csv_folder_path = f"/data/sda1/cv_slice_data/extracted_csv/{video_folder_name}"  # Folder where CSV files for each video are stored
 output_path = '/data/sda1/cv_slice_data/output/csv'  # Folder where sliced CSV files will be saved
+input_format = 'csv'    # extracted track format: 'csv' or 'npy' (memory-mapped float32, see utils/track_io.py)
+output_format = 'csv'   # slice format: 'csv', 'npy', or 'manifest' (one index file per session, no data copied)
+incremental = True      # skip slices whose track, offset and frame range are unchanged (ledger.sqlite in output_path)
 
 
-sheet_csv_map = {
-    'Gaming Museum':   f'{video_code}_museum_{video_suffix}_3d.csv',
-    'BowlingVR':       f'{video_code}_bowling_{video_suffix}_3d.csv',
-    'Gallery of H.K. History': f'{video_code}_gallery_{video_suffix}_3d.csv',
-    'Hong Kong Time Travel':   f'{video_code}_travel_{video_suffix}_3d.csv',
-    'Boss Fight':      f'{video_code}_boss_{video_suffix}_3d.csv',
-    'Candy Shooter':   f'{video_code}_candy_{video_suffix}_3d.csv',
-}
+sheet_csv_map = build_sheet_csv_map(video_code, video_suffix, input_format)
 
 # Path to your Excel file with cutting points
-sheet_video_map = {
-    'Gaming Museum':   f'{video_code}_museum_{video_suffix}.mp4',
-    'BowlingVR':       f'{video_code}_bowling_{video_suffix}.mp4',
-    'Gallery of H.K. History': f'{video_code}_gallery_{video_suffix}.mp4',
-    'Hong Kong Time Travel':   f'{video_code}_travel_{video_suffix}.mp4',
-    'Boss Fight':      f'{video_code}_boss_{video_suffix}.mp4',
-    'Candy Shooter':   f'{video_code}_candy_{video_suffix}.mp4'
-}
+sheet_video_map = build_sheet_video_map(video_code, video_suffix)
 
 # --- Function to Slice CSV Based on Frame Ranges and Offsets ---
-def slice_csv_based_on_offsets(csv_path, sheet_name, csv_name, data_collection_path, output_path, offset_df=None):
-     
+def slice_csv_based_on_offsets(csv_path, sheet_name, csv_name, data_collection_path, output_path, offset_df=None,
+                               output_format='csv', ledger=None, video_name=None):
+
     # --- read or default the offset data for the current sheet ---
-    video_name = sheet_video_map[sheet_name]
+    # video_name defaults to this script's configured sheet_video_map; the batch driver passes its own
+    if video_name is None:
+        video_name = sheet_video_map[sheet_name]
     if offset_df is None:
         offset_value = 0
     else:
         matched_row = offset_df[offset_df['video_name'] == video_name]
         if matched_row.empty:
             print(f"No offset data found for {video_name}. Skipping...")
-            return
+            return []
         offset_value = matched_row['offset'].values[0]  # Get the offset value for this video
 
-    # --- Extract relevant frame range information from the Data Collection Excel ---
-    df = pd.read_excel(data_collection_path, sheet_name=sheet_name)
-    # --- forward‐fill Action names so each row gets its corresponding action ---
-    df['action_ff'] = df['Action'].ffill()
-
-    rep_start_cols = [col for col in df.columns if 'Repetition' in col and 'Start' in col]
-    rep_end_cols = [col for col in df.columns if 'Repetition' in col and 'End' in col]
+    # --- Extract relevant frame range information from the (cached) Data Collection cut table ---
+    cuts = load_cut_table(data_collection_path)
+    cuts = cuts[cuts['sheet'] == sheet_name]
 
-    # Read the extracted 3D points CSV
-    csv_data = pd.read_csv(csv_path)
-    
     output_folder = os.path.join(output_path, f"{csv_name[:-7]}")
-    os.makedirs(output_folder, exist_ok=True)
-
-    # --- Iterate over each repetition and slice the CSV accordingly ---
-    for row_idx, row in df.iterrows():
-        for rep in range(1, len(rep_start_cols)+1):
-            start = row.get(f"Repetition {rep} Start")
-            end   = row.get(f"Repetition {rep} End")
-
-            if pd.notna(start) and pd.notna(end):
-                s = int(start) + offset_value
-                e = int(end) + offset_value
-                slice_df = csv_data.iloc[s:e].reset_index(drop=True)
-                # parse video_name to extract code, name, suffix
-                root = os.path.splitext(video_name)[0]
-                vid_code, vid_name, vid_suffix = root.split('_')
-                # grab and sanitize action name: use hyphens for multi-word
-                action = df.loc[row_idx, 'action_ff']
-                action_h = str(action).strip().replace(' ', '-').lower()
-                # build new slice CSV filename
-                out_name = (
-                    f"{vid_code}_{vid_name}_{vid_suffix}_"
-                    f"{action_h}_row{row_idx+1}_rep{rep}.csv"
-                )
-                slice_df.to_csv(os.path.join(output_folder, out_name), index=False)
-                print(f"Sliced CSV saved: {os.path.join(output_folder, out_name)}")
-
-
-# --- Load the Offset Excel and Data Collection Excel ---
-offset_df = pd.read_excel(offset_excel_path, sheet_name=video_folder_name)
-
-# --- Iterate over each sheet and process the corresponding CSV file ---
-for sheet_name, csv_name in sheet_csv_map.items():
-    csv_path = os.path.join(csv_folder_path, csv_name)
-    slice_csv_based_on_offsets(csv_path,
-                               sheet_name,
-                               csv_name,
-                               excel_path,
-                               output_path,
-                               offset_df,
-                               )
+    if output_format != 'manifest':
+        os.makedirs(output_folder, exist_ok=True)
+    entries = []
+
+    # parse video_name to extract code, name, suffix
+    vid_code, vid_name, vid_suffix = parse_video_name(video_name)
+
+    # --- Plan every slice, then drop the ones the ledger says are already up to date ---
+    if output_format == 'manifest':
+        if not os.path.exists(csv_path):
+            raise FileNotFoundError(f"No such track: {csv_path}")
+        source_digest = None
+    else:
+        source_digest = ledger.file_digest(csv_path) if ledger is not None else None
+    pending = []
+    for cut in cuts.itertuples(index=False):
+        s = cut.start + offset_value
+        e = cut.end + offset_value
+        # sanitize action name: use hyphens for multi-word
+        action_h = str(cut.action).strip().replace(' ', '-').lower()
+        # build new slice filename
+        out_name = (
+            f"{vid_code}_{vid_name}_{vid_suffix}_"
+            f"{action_h}_row{cut.row}_rep{cut.rep}.{output_format}"
+        )
+        if output_format == 'manifest':
+            entries.append(manifest_entry(os.path.splitext(out_name)[0], csv_path, video_name,
+                                          cut.action, cut.row, cut.rep, s, e))
+            continue
+        out_path = os.path.join(output_folder, out_name)
+        fingerprint = None
+        if ledger is not None:
+            fingerprint = ledger.fingerprint(source=source_digest, start=int(s), end=int(e), format=output_format)
+            if ledger.is_current(out_path, fingerprint):
+                print(f"Up to date, skipping: {out_path}")
+                metrics.count('slices_up_to_date')
+                continue
+        pending.append((cut, s, e, out_path, fingerprint))
+    if not pending:
+        return entries
+
+    # Read the extracted 3D points track; .npy tracks are memory-mapped and sliced as views
+    with metrics.span('csv_parse', file=os.path.basename(csv_path)):
+        if track_format(csv_path) == 'csv' and output_format == 'csv':
+            csv_data, track = pd.read_csv(csv_path), None
+        else:
+            csv_data, track = None, load_track(csv_path)
+
+    # --- Slice each pending repetition; files are renamed into place only once fully written ---
+    for cut, s, e, out_path, fingerprint in pending:
+        if output_format == 'npy':
+            save_track(out_path, track[s:e], source=csv_path, start=int(s), end=int(e), action=cut.action,
+                       row=int(cut.row), rep=int(cut.rep))
+        else:
+            with metrics.span('write', format='csv', frames=int(e - s)), atomic_output(out_path) as tmp_path:
+                if csv_data is not None:
+                    csv_data.iloc[s:e].reset_index(drop=True).to_csv(tmp_path, index=False)
+                else:
+                    track_to_frame(track[s:e]).to_csv(tmp_path, index=False)
+        if ledger is not None:
+            ledger.record(out_path, fingerprint, source=csv_path, video=video_name, offset=int(offset_value),
+                          row=int(cut.row), rep=int(cut.rep), start=int(s), end=int(e))
+        metrics.count('slices_written')
+        print(f"Sliced {output_format.upper()} saved: {out_path}")
+    return entries
+
+
+if __name__ == "__main__":
+    metrics.init_process('slice_csv')
+    # --- Load the Offset Excel (parsed once and cached) ---
+    offset_table = load_offset_table(offset_excel_path)
+    offset_df = offset_table[offset_table['session'] == video_folder_name]
+
+    # --- Iterate over each sheet and process the corresponding CSV file ---
+    ledger = JobLedger(output_path) if incremental and output_format != 'manifest' else None
+    manifest = []
+    for sheet_name, csv_name in sheet_csv_map.items():
+        csv_path = os.path.join(csv_folder_path, csv_name)
+        manifest += slice_csv_based_on_offsets(csv_path,
+                                               sheet_name,
+                                               csv_name,
+                                               excel_path,
+                                               output_path,
+                                               offset_df,
+                                               output_format=output_format,
+                                               ledger=ledger,
+                                               )
+    if ledger is not None:
+        ledger.close()
+
+    if output_format == 'manifest':
+        manifest_path = os.path.join(output_path, f"{video_folder_name}_manifest.jsonl")
+        total = write_manifest(manifest_path, manifest)
+        print(f"Manifest saved: {manifest_path} ({len(manifest)} slices added, {total} total)")
@@ -1,92 +1,265 @@
 import cv2
+import numpy as np
 import os
-import pandas as pd
+from utils import metrics
+from utils.annotations import load_cut_table
+from utils.clip_cut import cut_clips
+from utils.frame_index import load_frame_index, seek_frame
+from utils.ledger import JobLedger, partial_path
+from utils.sessions import build_sheet_video_map, parse_video_name
+from utils.video_pipeline import format_stage_report, run_pipeline
 
 # --- CONFIGURATION ---
 video_code = '06'
 video_suffix = 'L'
 video_base_path = "/data/sda1/mocap_data/raw_video/25.1.13_06"       # Path to your video file
 excel_path = f'/data/sda1/cv_slice_data/excel/DataCollection_{video_code}.xlsx'        # Path to your Excel file
-sheet_video_map = {
-    'Gaming Museum':   f'{video_code}_museum_{video_suffix}.mp4',
-    'BowlingVR':       f'{video_code}_bowling_{video_suffix}.mp4',
-    'Gallery of H.K. History': f'{video_code}_gallery_{video_suffix}.mp4',
-    'Hong Kong Time Travel':   f'{video_code}_travel_{video_suffix}.mp4',
-    'Boss Fight':      f'{video_code}_boss_{video_suffix}.mp4',
-    'Candy Shooter':   f'{video_code}_candy_{video_suffix}.mp4'
-}
+sheet_video_map = build_sheet_video_map(video_code, video_suffix)
 video_format = 'mp4'                     # File format
 output_path = f'./output/videos/'  # Folder where sliced CSV files will be saved
+slice_mode = 'stream'   # 'stream': decode each video once for all clips; 'seek': seek to every clip start;
+                        # 'smartcut': ffmpeg stream copy, re-encoding only the partial GOPs at the clip edges
+verify_clips = False    # smartcut only: decode each clip, check its frame count and compare it with a re-encode
+queue_depth = 8         # frames buffered between the decode / route / encode threads in stream mode
+incremental = True      # skip clips whose video and frame range are unchanged (ledger.sqlite in output_path)
 
-# --- SETUP ---
-for sheet_name, video_file in sheet_video_map.items():
-    video_path = os.path.join(video_base_path, video_file)
-    cap = cv2.VideoCapture(video_path)
 
+# --- Collect every (start, end, clip filename) to cut from one video ---
+def collect_clip_ranges(cuts, video_file, output_folder):
+    # cuts: rows of the cut table (utils.annotations) for this video's sheet
+    # parse video_file name to extract code, name, suffix
+    vid_code, vid_name, vid_suffix = parse_video_name(video_file)
+
+    clips = []
+    for cut in cuts.itertuples(index=False):
+        # sanitize action name for this row
+        action_s = str(cut.action).replace(' ', '-').lower()
+        # build new clip filename
+        clip_filename = os.path.join(
+            output_folder,
+            f"{vid_code}_{vid_name}_{vid_suffix}_"
+            f"{action_s}_row{cut.row}_rep{cut.rep}.mp4"
+        )
+        clips.append((cut.start, cut.end, clip_filename))
+    return clips
+
+
+# --- Clips are encoded to a .partial file and renamed once the writer is released ---
+def open_clip_writer(clip_filename, fourcc, fps, frame_size):
+    return cv2.VideoWriter(partial_path(clip_filename), fourcc, fps, frame_size)
+
+
+def close_clip_writer(out, clip_filename, keep=True):
+    out.release()
+    if keep:
+        os.replace(partial_path(clip_filename), clip_filename)
+        metrics.count('clips_written')
+    elif os.path.exists(partial_path(clip_filename)):
+        os.remove(partial_path(clip_filename))
+        metrics.count('clips_discarded')
+
+
+# --- Seek mode: seek to each clip start and decode from the nearest keyframe ---
+# with a frame index (utils/frame_index.py) every seek is checked against the real pts and lands exactly
+# on start_frame; without one it trusts OpenCV's frame-number seek as before
+def slice_video_seek(cap, clips, fourcc, fps, frame_size, index=None):
+    saved = []
+    for start_frame, end_frame, clip_filename in clips:
+        out = open_clip_writer(clip_filename, fourcc, fps, frame_size)
+
+        try:
+            with metrics.span('seek', frame=int(start_frame), exact=index is not None):
+                if index is None:
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+                    ret, frame = cap.read()
+                elif seek_frame(cap, index, start_frame):
+                    ret, frame = cap.retrieve()
+                else:
+                    ret, frame = False, None
+            written = 0
+            for i in range(start_frame, end_frame + 1):
+                if i > start_frame:
+                    ret, frame = cap.read()
+                if not ret:
+                    break
+                out.write(frame)
+                written += 1
+            metrics.count('frames_decoded', written)
+        except BaseException:
+            close_clip_writer(out, clip_filename, keep=False)
+            raise
+
+        close_clip_writer(out, clip_filename)
+        saved.append(clip_filename)
+        print(f"Saved: {clip_filename}")
+    return saved
+
+
+# --- Stream mode: decode the video once and fan each frame out to every open clip ---
+# decode, routing and encode run as a bounded three-stage pipeline (utils/video_pipeline.py)
+def slice_video_streaming(cap, clips, fourcc, fps, frame_size, queue_depth=8):
+    pending = sorted(clips)  # by start frame
+    saved = []
+    if not pending:
+        return saved
+    last_frame = max(0, max(max(start, end) for start, end, _ in pending))
+
+    # frames covered by at least one clip; everything else is only grabbed, never converted.
+    # a negative start (negative offset) starts at frame 0, as the frame-number seek does
+    coverage = np.zeros(last_frame + 2, dtype=np.int64)
+    for start_frame, end_frame, _ in pending:
+        first = max(start_frame, 0)
+        coverage[first] += 1
+        coverage[max(first, end_frame) + 1] -= 1
+    needed = np.cumsum(coverage) > 0
+
+    grabbed = [0]
+
+    def decode():
+        for frame_idx in range(last_frame + 1):
+            if needed[frame_idx]:
+                ret, frame = cap.read()
+            else:
+                ret, frame = cap.grab(), None
+            if not ret:
+                return
+            if frame is not None:
+                yield frame_idx, frame
+            else:
+                grabbed[0] += 1
+
+    next_clip = [0]
+    active = []   # (start_frame, end_frame, clip_filename)
+
+    def route(item):
+        frame_idx, frame = item
+        opens, targets, closes = [], [], []
+        while next_clip[0] < len(pending) and pending[next_clip[0]][0] <= frame_idx:
+            opens.append(pending[next_clip[0]][2])
+            active.append(pending[next_clip[0]])
+            next_clip[0] += 1
+        for clip in list(active):
+            _, end_frame, clip_filename = clip
+            if frame_idx <= end_frame:
+                targets.append(clip_filename)
+            if frame_idx >= end_frame:
+                closes.append(clip_filename)
+                active.remove(clip)
+        return frame, opens, targets, closes
+
+    writers = {}
+
+    def write(item):
+        frame, opens, targets, closes = item
+        for clip_filename in opens:
+            writers[clip_filename] = open_clip_writer(clip_filename, fourcc, fps, frame_size)
+        for clip_filename in targets:
+            writers[clip_filename].write(frame)
+        for clip_filename in closes:
+            close_clip_writer(writers.pop(clip_filename), clip_filename)
+            saved.append(clip_filename)
+            print(f"Saved: {clip_filename}")
+
+    completed = False
+    try:
+        stats = run_pipeline(decode(), route, write, queue_depth=queue_depth, name='slice_video.stream')
+        completed = True
+        metrics.count('frames_decoded', stats['frames'])
+        metrics.count('frames_skipped', grabbed[0])
+        print(f"[TIMING] {format_stage_report(stats)}")
+    finally:
+        # video ended early: close what is open and report what was never reached;
+        # after an error the open clips are incomplete and are discarded instead
+        for clip_filename, out in writers.items():
+            close_clip_writer(out, clip_filename, keep=completed)
+            if completed:
+                saved.append(clip_filename)
+                print(f"Saved (video ended early): {clip_filename}")
+        for start_frame, _, clip_filename in pending[next_clip[0]:]:
+            print(f"Skipped: {clip_filename} starts at frame {start_frame}, past the end of the video")
+    return saved
+
+
+def slice_video_file(video_path, clips, mode='stream', queue_depth=8, verify=False, ledger=None):
+    if not os.path.exists(video_path):
+        print(f"Error: Could not open video {video_path}.")
+        return False
+
+    # --- With a ledger, only clips whose video or frame range changed are cut again ---
+    fingerprints = {}
+    if ledger is not None:
+        video_digest = ledger.file_digest(video_path, content=False)   # size + mtime, videos are too big to hash
+        stale = []
+        for start_frame, end_frame, clip_filename in clips:
+            fingerprint = ledger.fingerprint(source=video_digest, start=int(start_frame), end=int(end_frame),
+                                             mode=mode)
+            if ledger.is_current(clip_filename, fingerprint):
+                print(f"Up to date, skipping: {clip_filename}")
+                metrics.count('clips_up_to_date')
+                continue
+            fingerprints[clip_filename] = (fingerprint, int(start_frame), int(end_frame))
+            stale.append((start_frame, end_frame, clip_filename))
+        clips = stale
+        if not clips:
+            return True
+
+    if mode == 'smartcut':
+        # ffmpeg backend, no OpenCV decoding at all (utils/clip_cut.py)
+        with metrics.span('smartcut', file=os.path.basename(video_path), clips=len(clips)):
+            results = cut_clips(video_path, clips, mode='smart', verify=verify, probe=load_frame_index(video_path, exact=True))
+        saved = [clip_filename for clip_filename, ok in results if ok]
+        metrics.count('clips_written', len(saved))
+    else:
+        saved = _slice_with_opencv(video_path, clips, mode, queue_depth)
+        if saved is None:
+            return False
+
+    if ledger is not None:
+        for clip_filename in saved:
+            fingerprint, start_frame, end_frame = fingerprints[clip_filename]
+            ledger.record(clip_filename, fingerprint, source=video_path, start=start_frame, end=end_frame)
+    return True
+
+
+def _slice_with_opencv(video_path, clips, mode, queue_depth):
+    # returns the clip files written, or None if the video cannot be opened
+    cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
-        print("Error: Could not open video.")
-        exit()
+        print(f"Error: Could not open video {video_path}.")
+        return None
 
     fps = cap.get(cv2.CAP_PROP_FPS)
     width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
     fourcc = cv2.VideoWriter_fourcc(*'mp4v')  # Use 'XVID' for .avi if needed
 
-    output_folder = os.path.join(output_path, f"{video_file[:-4]}")
-    os.makedirs(output_folder, exist_ok=True)
-    df = pd.read_excel(excel_path, sheet_name=sheet_name)
-    # --- forward‐fill Action names so each row gets its corresponding action ---
-    df['action_ff'] = df['Action'].ffill()
+    try:
+        if mode == 'stream':
+            return slice_video_streaming(cap, clips, fourcc, fps, (width, height), queue_depth=queue_depth)
+        elif mode == 'seek':
+            try:
+                index = load_frame_index(video_path)
+            except RuntimeError as e:
+                print(f"[WARN] no frame index for {video_path}, seeking by frame number: {e}")
+                index = None
+            return slice_video_seek(cap, clips, fourcc, fps, (width, height), index=index)
+        raise ValueError(f"Unknown slice mode: {mode}")
+    finally:
+        cap.release()
 
-    rep_start_cols = [col for col in df.columns if 'Repetition' in col and 'Start' in col]
-    rep_end_cols = [col for col in df.columns if 'Repetition' in col and 'End' in col]
-    rep_nums = set()
-    for col in rep_start_cols + rep_end_cols:
-        try:
-            rep_num = int(col.split()[1])
-            rep_nums.add(rep_num)
-        except:
-            continue
-    num_repetitions = max(rep_nums) if rep_nums else 0
-    print(f"[{sheet_name}] max repetitions = {num_repetitions}")
-
-    for row_idx, row in df.iterrows():
-        for rep in range(1, num_repetitions + 1):
-            start_col = f"Repetition {rep} Start"
-            end_col   = f"Repetition {rep} End"
-
-            start = row.get(start_col)
-            end   = row.get(end_col)
-
-            if pd.notna(start) and pd.notna(end):
-                start_frame = int(start)
-                end_frame   = int(end)
-                # parse video_file name to extract code, name, suffix
-                root, _ = os.path.splitext(video_file)
-                vid_code, vid_name, vid_suffix = root.split('_')
-                # grab and sanitize action name for this row
-                action     = df.loc[row_idx, 'action_ff']
-                action_s   = str(action).replace(' ', '-').lower()
-                # build new clip filename
-                clip_filename = os.path.join(
-                    output_folder,
-                    f"{vid_code}_{vid_name}_{vid_suffix}_"
-                    f"{action_s}_row{row_idx+1}_rep{rep}.mp4"
-                )
-
-                out = cv2.VideoWriter(clip_filename, fourcc, fps, (width, height))
-                cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
-
-                for i in range(start_frame, end_frame + 1):
-                    ret, frame = cap.read()
-                    if not ret:
-                        break
-                    out.write(frame)
 
-                out.release()
-                print(f"Saved: {clip_filename}")
-            else:
-                print(f"Skipped: row {row_idx+1}, repetition {rep} (missing data)")
+if __name__ == "__main__":
+    metrics.init_process('slice_video')
+    cut_table = load_cut_table(excel_path)
+    ledger = JobLedger(output_path) if incremental else None
+    for sheet_name, video_file in sheet_video_map.items():
+        video_path = os.path.join(video_base_path, video_file)
+        output_folder = os.path.join(output_path, f"{video_file[:-4]}")
+        os.makedirs(output_folder, exist_ok=True)
+        cuts = cut_table[cut_table['sheet'] == sheet_name]
 
-    cap.release()
-print("All available clips saved.")
+        clips = collect_clip_ranges(cuts, video_file, output_folder)
+        if not slice_video_file(video_path, clips, mode=slice_mode, queue_depth=queue_depth, verify=verify_clips,
+                                ledger=ledger):
+            exit()
+    print("All available clips saved.")
@@ -1,134 +1,144 @@
 import os
-import pandas as pd
+from utils import metrics
+from utils.annotations import load_offset_table
 from utils.extract_24_keypoint_from_csv import extract_3d_points_from_csv
+from utils.ledger import JobLedger
+from utils.preflight import preflight
 
 # offset_excel_path = r"C:\Users\16850\Desktop\csv_offset.xlsx"
 # base_video_path = "D:/cv_data/raw_video"
 # base_csv_path = "D:/cv_data/smoothed"
 
-def check_files_exist(excel_path, video_base_path, csv_base_path):
-    # 检查 Excel 是否为空
+PROBLEM_LABELS = {
+    'video_missing': '视频文件缺失',
+    'csv_missing': 'CSV 文件缺失',
+    'video_unreadable': '视频无法读取帧数',
+    'csv_header': 'CSV 表头无效',
+}
+
+
+def plan_jobs(excel_path, video_base_path, csv_base_path, skiprows=1, resample=None):
+    # 并发预检（utils.preflight）：每个目录只列一次，视频帧数与 CSV 表头在线程池中探测；
+    # 返回 (plan, problems)，plan 可直接交给 generate_3d_csvs；Excel 无法打开或为空时返回 None
     try:
-        xl = pd.ExcelFile(excel_path)
+        offset_table = load_offset_table(excel_path)
     except Exception as e:
         print(f"无法打开 Excel 文件: {e}")
-        return
+        return None
 
-    if not xl.sheet_names:
+    if offset_table.empty:
         print("Excel 文件为空，不进行检查。")
-        return
-    err = False
-
-    for sheet in xl.sheet_names:
-        # print(f"\n 正在处理 sheet: {sheet}")
-        df = xl.parse(sheet)
-        if df.empty:
-            print(f"⚠️ sheet {sheet} 内容为空，跳过。")
-            continue
+        return None
+    return preflight(offset_table, video_base_path, csv_base_path, skiprows=skiprows, need_time=bool(resample))
 
-        video_root = os.path.join(video_base_path, sheet)
 
-        for _, row in df.iterrows():
-            video_name = str(row['video_name']).strip()
-            csv_name = str(row['csv_name']).strip()
+def report_problems(problems):
+    if problems:
+        print(f"⚠️ 预检发现 {len(problems)} 个问题:")
+    for kind, path, detail in problems:
+        print(f"  - {PROBLEM_LABELS[kind]}: {path}" + (f" ({detail})" if detail else ""))
 
-            video_path = os.path.join(video_root, video_name)
-            csv_path = os.path.join(csv_base_path, csv_name)
 
-            video_exists = os.path.exists(video_path)
-            csv_exists = os.path.exists(csv_path)
-            
-            if not video_exists or not csv_exists:
-                err = True
-                print(f"⚠️ 文件缺失:")
-                if not video_exists:
-                    print(f"  - 视频文件缺失: {video_path}")
-                if not csv_exists:
-                    print(f"  - CSV 文件缺失: {csv_path}")
-            
-            # print(f"📹 {video_name}: {'✅ 存在' if video_exists else '❌ 不存在'}")
-            # print(f"📄 {csv_name}: {'✅ 存在' if csv_exists else '❌ 不存在'}")
-    return err
+def check_files_exist(excel_path, video_base_path, csv_base_path):
+    checked = plan_jobs(excel_path, video_base_path, csv_base_path)
+    if checked is None:
+        return
+    _, problems = checked
+    report_problems(problems)
+    return bool(problems)
 
 
 
 # if not check_files_exist(offset_excel_path, base_video_path, base_csv_path):
 #     print("✅ 所有文件存在，继续执行。")
 
-import cv2  # 用于获取视频帧数
+from utils.frame_index import load_frame_index  # 用于获取视频帧数
 
 def get_video_frame_count(video_path):
+    # 逐帧索引的真实帧数（容器里的 CAP_PROP_FRAME_COUNT 对 VFR/封装异常的 mp4 不可靠），按 size+mtime 缓存
     try:
-        cap = cv2.VideoCapture(video_path)
-        if not cap.isOpened():
-            return -1
-        frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        cap.release()
-        return frames
+        return load_frame_index(video_path)['num_frames']
     except Exception as e:
         print(f"⚠️ 无法读取视频帧数: {video_path}, 错误: {e}")
         return -1
 
-def generate_3d_csvs(excel_path, video_base_path, csv_base_path, output_dir, skiprows=1):
-    try:
-        xl = pd.ExcelFile(excel_path)
-    except Exception as e:
-        print(f"❌ 无法打开 Excel 文件: {e}")
-        return
-
-    if not xl.sheet_names:
-        print("⚠️ Excel 文件为空，不生成。")
-        return
+def track_fingerprint(ledger, input_csv_path, offset, total_frames, skiprows=1, resample=None, video_path=None):
+    # 输出只取决于原始 CSV 内容、offset 和视频帧数（重采样时还有视频本身）；改一个 offset 只会重建对应的那一个文件
+    inputs = dict(source=ledger.file_digest(input_csv_path), offset=int(offset),
+                  total_frames=int(total_frames), skiprows=int(skiprows))
+    if resample:
+        inputs.update(resample=resample, video=ledger.file_digest(video_path, content=False))
+    return ledger.fingerprint(**inputs)
+
+
+def generate_3d_csvs(excel_path, video_base_path, csv_base_path, output_dir, skiprows=1, output_format='csv',
+                     incremental=True, resample=None, plan=None):
+    # resample: None 表示 mocap 第 i 行即视频第 i 帧（原行为）；'nearest' / 'linear' 按时间戳对齐到视频帧
+    # plan: plan_jobs 的预检结果；不给时在这里预检，有问题的行打印后跳过
+    if plan is None:
+        checked = plan_jobs(excel_path, video_base_path, csv_base_path, skiprows=skiprows, resample=resample)
+        if checked is None:
+            return
+        plan, problems = checked
+        report_problems(problems)
 
     os.makedirs(output_dir, exist_ok=True)
-
-    for sheet in xl.sheet_names:
-        df = xl.parse(sheet)
-        if df.empty:
-            print(f"⚠️ sheet {sheet} 内容为空，跳过。")
-            continue
-
-        video_root = os.path.join(video_base_path, sheet)
-        sheet_output_dir = os.path.join(output_dir, sheet)
-        os.makedirs(sheet_output_dir, exist_ok=True)
-
-        for _, row in df.iterrows():
-            video_name = str(row['video_name']).strip()
-            csv_name = str(row['csv_name']).strip()
-            offset = int(row['offset']) if 'offset' in row and pd.notna(row['offset']) else 0
-
-            video_path = os.path.join(video_root, video_name)
-            input_csv_path = os.path.join(csv_base_path, csv_name)
-            output_csv_path = os.path.join(sheet_output_dir, f"{os.path.splitext(video_name)[0]}_3d.csv")
-
-            if not os.path.exists(video_path):
-                print(f"❌ 找不到视频文件: {video_path}，跳过。")
-                continue
-            if not os.path.exists(input_csv_path):
-                print(f"❌ 找不到原始 CSV 文件: {input_csv_path}，跳过。")
-                continue
-
+    ledger = JobLedger(output_dir) if incremental else None   # output_dir/ledger.sqlite
+
+    for job in plan:
+        csv_name = job['csv_name']
+        offset = job['offset']
+        video_path = job['video_path']
+        input_csv_path = job['input_csv_path']
+        total_frames = job['total_frames']
+        if total_frames is None:
+            # 预检只用容器头确认视频可读；提取前才取精确帧数（逐帧索引，按 size+mtime 缓存），与 batch_slice 一致
             total_frames = get_video_frame_count(video_path)
             if total_frames <= 0:
-                print(f"⚠️ 无法读取视频帧数: {video_path}，跳过。")
+                print(f"⚠️ 视频帧数无效，跳过: {csv_name} ({video_path})")
                 continue
+        sheet_output_dir = os.path.join(output_dir, job['session'])
+        os.makedirs(sheet_output_dir, exist_ok=True)
+        output_csv_path = os.path.join(sheet_output_dir, f"{os.path.splitext(job['video_name'])[0]}_3d.{output_format}")
+
+        if ledger is None:
             if os.path.exists(output_csv_path):
                 print(f"✅ 已存在输出文件: {output_csv_path}，跳过。")
                 continue
-            print(f"🔄 正在处理: {csv_name} -> {output_csv_path} | offset={offset}, total_frames={total_frames}")
-            try:
-                extract_3d_points_from_csv(input_csv_path, output_csv_path, total_frames=total_frames, skiprows=skiprows, offset=offset)
-            except Exception as e:
-                print(f"❌ 处理失败: {csv_name}, 错误: {e}")
+        else:
+            fingerprint = track_fingerprint(ledger, input_csv_path, offset, total_frames, skiprows, resample, video_path)
+            if ledger.is_current(output_csv_path, fingerprint):
+                print(f"✅ 输出文件已是最新: {output_csv_path}，跳过。")
+                continue
+        print(f"🔄 正在处理: {csv_name} -> {output_csv_path} | offset={offset}, total_frames={total_frames}")
+        try:
+            # 输出先写入临时文件再重命名，中断后不会留下半个文件
+            frame_times = load_frame_index(video_path)['times'] if resample else None
+            extract_3d_points_from_csv(input_csv_path, output_csv_path, total_frames=total_frames, skiprows=skiprows, offset=offset,
+                                       frame_times=frame_times, resample=resample or 'linear')
+        except Exception as e:
+            print(f"❌ 处理失败: {csv_name}, 错误: {e}")
+            continue
+        if ledger is not None:
+            ledger.record(output_csv_path, fingerprint, source=input_csv_path, video=job['video_name'],
+                          offset=int(offset), total_frames=int(total_frames))
+
+    if ledger is not None:
+        ledger.close()
 
 
 if __name__ == "__main__":
+    metrics.init_process('sync_all_video')
     offset_excel_path = "./input/new_csv_offset.xlsx"
     base_video_path = "/data/sda1/mocap_data/raw_video"
     base_csv_path = "/data/sda1/mocap_data/smoothed"
     output_dir = "./output"
 
-    # 先检查是否缺文件
-    if not check_files_exist(offset_excel_path, base_video_path, base_csv_path):
-        print("所有文件存在，开始生成3D CSV文件。")
-        generate_3d_csvs(offset_excel_path, base_video_path, base_csv_path, output_dir)
+    # 先并发预检，预检结果直接作为生成计划
+    checked = plan_jobs(offset_excel_path, base_video_path, base_csv_path)
+    if checked is not None:
+        plan, problems = checked
+        report_problems(problems)
+        if not problems:
+            print(f"所有文件存在，开始生成3D CSV文件（{len(plan)} 个）。")
+            generate_3d_csvs(offset_excel_path, base_video_path, base_csv_path, output_dir, plan=plan)
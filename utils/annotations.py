@@ -0,0 +1,139 @@
+import hashlib
+import os
+import pickle
+import re
+
+import openpyxl
+import pandas as pd
+
+from utils import metrics
+from utils.cache import CACHE_DIR, cache_file, write_cache
+
+CACHE_VERSION = 1
+
+CUT_COLUMNS = ['sheet', 'row', 'action', 'rep', 'start', 'end']
+OFFSET_COLUMNS = ['session', 'video_name', 'csv_name', 'offset']
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# --- Parse one DataCollection workbook into (sheet, row, action, rep, start, end) ---
+def parse_cut_table(data_collection_path):
+    records = []
+    for sheet_name, df in pd.read_excel(data_collection_path, sheet_name=None).items():
+        if 'Action' not in df.columns:
+            continue
+        # --- forward‐fill Action names so each row gets its corresponding action ---
+        actions = df['Action'].ffill()
+
+        rep_nums = sorted({int(m.group(1)) for col in df.columns
+                           for m in [re.match(r"Repetition ([0-9]+) Start$", str(col))] if m
+                           and f"Repetition {m.group(1)} End" in df.columns})
+        for rep in rep_nums:
+            starts = df[f"Repetition {rep} Start"]
+            ends = df[f"Repetition {rep} End"]
+            valid = starts.notna() & ends.notna()
+            for row_idx in df.index[valid]:
+                # row is 1-based, as in the _row{r}_ part of slice file names
+                records.append((sheet_name, row_idx + 1, actions[row_idx], rep,
+                                int(starts[row_idx]), int(ends[row_idx])))
+
+    table = pd.DataFrame.from_records(records, columns=CUT_COLUMNS)
+    return table.sort_values(['sheet', 'row', 'rep'], kind='stable').reset_index(drop=True)
+
+
+# --- Parse the offset workbook (one sheet per session) into one table ---
+def parse_offset_table(offset_excel_path):
+    frames = []
+    for session, df in pd.read_excel(offset_excel_path, sheet_name=None).items():
+        if df.empty:
+            continue
+        frames.append(pd.DataFrame({
+            'session': session,
+            'video_name': df['video_name'].astype(str).str.strip(),
+            'csv_name': df['csv_name'].astype(str).str.strip(),
+            'offset': pd.to_numeric(df['offset'], errors='coerce').fillna(0).astype(int)
+                      if 'offset' in df.columns else 0,
+        }))
+    if not frames:
+        return pd.DataFrame(columns=OFFSET_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+
+# --- Write extra per-video columns (e.g. suggested offsets) back into the offset workbook ---
+def write_offset_columns(offset_excel_path, values):
+    # values: {session: {video_name: {column: value}}}; existing columns (offset included) are left as they are
+    wb = openpyxl.load_workbook(offset_excel_path)
+    for session, rows in values.items():
+        if session not in wb.sheetnames:
+            print(f"[WARN] no sheet '{session}' in {offset_excel_path}")
+            continue
+        ws = wb[session]
+        header = {str(c.value).strip(): c.column for c in ws[1] if c.value is not None}
+        if 'video_name' not in header:
+            print(f"[WARN] sheet '{session}' has no video_name column")
+            continue
+        for column in dict.fromkeys(col for cols in rows.values() for col in cols):
+            if column not in header:
+                header[column] = ws.max_column + 1
+                ws.cell(row=1, column=header[column], value=column)
+        for r in range(2, ws.max_row + 1):
+            video_name = ws.cell(row=r, column=header['video_name']).value
+            for column, value in rows.get(str(video_name).strip(), {}).items():
+                ws.cell(row=r, column=header[column], value=value)
+
+    # same temp file + rename as the caches, so a crash never leaves a broken workbook
+    root, ext = os.path.splitext(offset_excel_path)
+    tmp_path = f"{root}.{os.getpid()}.tmp{ext}"
+    wb.save(tmp_path)
+    os.replace(tmp_path, offset_excel_path)
+
+
+def load_cached(path, kind, parse_fn, cache_dir=None):
+    with metrics.span('excel_load', kind=kind, file=os.path.basename(path)) as sp:
+        table, sp['cache'] = _load_cached(path, kind, parse_fn, cache_dir)
+    return table
+
+
+def _load_cached(path, kind, parse_fn, cache_dir=None):
+    # 缓存以 (size, mtime) 快速命中；mtime 变了但内容 hash 未变时仍命中
+    # 返回 (table, 'hit' / 'rehash' / 'parsed')
+    cache_dir = cache_dir or CACHE_DIR
+    cache_path = cache_file(path, kind, cache_dir)
+    st = os.stat(path)
+
+    entry = None
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'rb') as f:
+                entry = pickle.load(f)
+        except Exception as e:
+            print(f"[WARN] ignoring unreadable cache {cache_path}: {e}")
+    if entry is not None and entry.get('version') == CACHE_VERSION:
+        if (entry['size'], entry['mtime_ns']) == (st.st_size, st.st_mtime_ns):
+            return entry['table'], 'hit'
+        digest = file_sha256(path)
+        if digest == entry['sha256']:
+            write_cache(cache_path, dict(entry, size=st.st_size, mtime_ns=st.st_mtime_ns))
+            return entry['table'], 'rehash'
+    else:
+        digest = file_sha256(path)
+
+    table = parse_fn(path)
+    write_cache(cache_path, {'version': CACHE_VERSION, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns,
+                              'sha256': digest, 'table': table})
+    return table, 'parsed'
+
+
+def load_cut_table(data_collection_path, cache_dir=None):
+    return load_cached(data_collection_path, 'cuts', parse_cut_table, cache_dir)
+
+
+def load_offset_table(offset_excel_path, cache_dir=None):
+    return load_cached(offset_excel_path, 'offsets', parse_offset_table, cache_dir)
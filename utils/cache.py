@@ -0,0 +1,24 @@
+import hashlib
+import os
+import pickle
+
+# --- On-disk cache shared by the parsed workbooks (utils/annotations.py) and frame indexes (utils/frame_index.py) ---
+CACHE_DIR = os.environ.get('DASE_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'dase_slicing'))
+
+
+def cache_file(path, kind, cache_dir):
+    # one pickle per (source file, kind); the absolute path keeps same-named files in different folders apart
+    path_key = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(cache_dir, f"{os.path.basename(path)}.{path_key}.{kind}.pkl")
+
+
+def write_cache(cache_path, entry):
+    # write to a temp file then rename, so parallel workers never read half a cache file
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"[WARN] could not write cache {cache_path}: {e}")
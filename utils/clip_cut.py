@@ -0,0 +1,218 @@
+import json
+import math
+import os
+import subprocess
+import tempfile
+from fractions import Fraction
+
+import numpy as np
+
+FFMPEG = os.environ.get('FFMPEG_BINARY', 'ffmpeg')
+FFPROBE = os.environ.get('FFPROBE_BINARY', 'ffprobe')
+
+# source codec -> encoder used for the partial GOPs at the clip edges (and for full re-encodes)
+EDGE_ENCODERS = {
+    'h264':  ['-c:v', 'libx264', '-preset', 'fast', '-crf', '16'],
+    'hevc':  ['-c:v', 'libx265', '-preset', 'fast', '-crf', '18'],
+    'mpeg4': ['-c:v', 'mpeg4', '-q:v', '2'],
+}
+# the concat demuxer keeps only the first segment's extradata (avcC / hvcC), so every segment carries its
+# parameter sets (SPS/PPS, VOL) in-band on each keyframe: copied GOPs never decode against the edge
+# encoder's headers. Copied segments convert the stored headers, encoded ones repeat the encoder's.
+COPY_BSF = {
+    'h264':  'h264_mp4toannexb',
+    'hevc':  'hevc_mp4toannexb',
+    'mpeg4': 'dump_extra',
+}
+EDGE_BSF = 'dump_extra'
+VERIFY_MIN_PSNR = 30.0   # dB, worst frame of a smart cut against a full re-encode of the same range
+
+
+def _run(cmd):
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{os.path.basename(cmd[0])} failed ({result.returncode}): {result.stderr.strip()}")
+    return result.stdout
+
+
+# --- Probe: one packet-level pass (no decoding) for codec info, per-frame pts and keyframes ---
+def probe_video(video_path):
+    out = _run([FFPROBE, '-v', 'error', '-select_streams', 'v:0',
+                '-show_entries', 'format=start_time:stream=codec_name,pix_fmt,time_base,avg_frame_rate:packet=pts,flags',
+                '-of', 'json', video_path])
+    info = json.loads(out)
+    stream = info['streams'][0]
+    packets = [p for p in info.get('packets', []) if p.get('pts') not in (None, 'N/A')]
+    pts = np.array([int(p['pts']) for p in packets], dtype=np.int64)
+    is_key = np.array(['K' in p.get('flags', '') for p in packets], dtype=bool)
+    order = np.argsort(pts, kind='stable')       # decode order -> presentation order
+    start_time = info.get('format', {}).get('start_time')
+    return {
+        'codec': stream.get('codec_name'),
+        'pix_fmt': stream.get('pix_fmt'),
+        'time_base': Fraction(stream['time_base']),
+        'start_time': Fraction(start_time) if start_time not in (None, 'N/A') else Fraction(0),
+        'pts': pts[order],
+        'keyframes': np.flatnonzero(is_key[order]),
+    }
+
+
+def count_frames(video_path):
+    # decoded frames, not packets: a packet that does not decode is not a frame
+    out = _run([FFPROBE, '-v', 'error', '-select_streams', 'v:0', '-count_frames',
+                '-show_entries', 'stream=nb_read_frames', '-of', 'json', video_path])
+    return int(json.loads(out)['streams'][0]['nb_read_frames'])
+
+
+def min_psnr(video_path, reference_path):
+    # worst per-frame PSNR (dB) of video_path against reference_path, both decoded in full
+    out = _run([FFMPEG, '-v', 'error', '-i', video_path, '-i', reference_path,
+                '-lavfi', '[0:v][1:v]psnr=stats_file=-', '-f', 'null', '-'])
+    values = [float(field.split(':', 1)[1]) for line in out.splitlines() for field in line.split()
+              if field.startswith('psnr_avg:')]
+    return min(values) if values else float('nan')
+
+
+def _frame_time(probe, i):
+    # seconds from the start of the file, as ffmpeg's -ss expects
+    return probe['pts'][i] * probe['time_base'] - probe['start_time']
+
+
+def _seek_between(probe, i):
+    # halfway between frame i-1 and frame i: accurate (decoding) seek keeps frame i and drops i-1
+    t = (_frame_time(probe, i - 1) + _frame_time(probe, i)) / 2
+    return f"{float(t):.6f}"
+
+
+def _seek_to_keyframe(probe, k):
+    # rounded up to the microsecond so the keyframe at or before it is exactly k
+    t = _frame_time(probe, k)
+    return f"{math.ceil(t * 1_000_000) / 1_000_000:.6f}"
+
+
+# --- Split [start, end] (inclusive) into re-encoded edges and stream-copied whole GOPs ---
+def plan_segments(probe, start_frame, end_frame, mode='smart'):
+    if mode == 'reencode':
+        return [('encode', start_frame, end_frame)]
+    num_frames = len(probe['pts'])
+    keys = probe['keyframes']
+
+    first = np.searchsorted(keys, start_frame, side='left')
+    if first == len(keys):
+        return [('encode', start_frame, end_frame)]
+    k_first = int(keys[first])
+
+    # the copied part has to end right before a keyframe (or at the end of the stream)
+    if end_frame + 1 >= num_frames:
+        k_stop = num_frames
+    else:
+        k_stop = int(keys[np.searchsorted(keys, end_frame + 1, side='right') - 1])
+    if k_stop <= k_first:
+        return [('encode', start_frame, end_frame)]
+
+    segments = []
+    if start_frame < k_first:
+        segments.append(('encode', start_frame, k_first - 1))
+    segments.append(('copy', k_first, k_stop - 1))
+    if k_stop <= end_frame:
+        segments.append(('encode', k_stop, end_frame))
+    return segments
+
+
+def _segment_cmd(video_path, probe, kind, first, last, seg_path):
+    num = last - first + 1
+    if kind == 'copy':
+        seek = ['-ss', _seek_to_keyframe(probe, first)] if first > 0 else []
+        return [FFMPEG, '-v', 'error', '-y', *seek, '-i', video_path, '-map', '0:v:0',
+                '-frames:v', str(num), '-an', '-c', 'copy', '-bsf:v', COPY_BSF.get(probe['codec'], EDGE_BSF),
+                '-avoid_negative_ts', 'make_zero', seg_path]
+    encoder = EDGE_ENCODERS.get(probe['codec'], EDGE_ENCODERS['h264'])
+    pix_fmt = ['-pix_fmt', probe['pix_fmt']] if probe['pix_fmt'] else []
+    seek = ['-ss', _seek_between(probe, first)] if first > 0 else []
+    return [FFMPEG, '-v', 'error', '-y', *seek, '-i', video_path, '-map', '0:v:0',
+            '-frames:v', str(num), '-an', *encoder, *pix_fmt, '-bsf:v', EDGE_BSF,
+            '-video_track_timescale', str(probe['time_base'].denominator), seg_path]
+
+
+def cut_clip(video_path, probe, start_frame, end_frame, out_path, mode='smart'):
+    # frame-exact [start_frame, end_frame], same semantics as the OpenCV slicer
+    end_frame = min(end_frame, len(probe['pts']) - 1)
+    if end_frame < start_frame:
+        raise ValueError(f"empty clip: frames {start_frame}-{end_frame} of {video_path}")
+    if mode == 'smart' and probe['codec'] not in EDGE_ENCODERS:
+        mode = 'reencode'   # no matching edge encoder, the copied GOPs could not be concatenated
+    segments = plan_segments(probe, start_frame, end_frame, mode)
+
+    out_dir = os.path.dirname(os.path.abspath(out_path))
+    with tempfile.TemporaryDirectory(dir=out_dir, prefix='.cut_') as tmp:
+        seg_paths = []
+        for n, (kind, first, last) in enumerate(segments):
+            seg_path = os.path.join(tmp, f"seg{n}.mp4")
+            _run(_segment_cmd(video_path, probe, kind, first, last, seg_path))
+            seg_paths.append(seg_path)
+
+        if len(seg_paths) == 1:
+            os.replace(seg_paths[0], out_path)
+        else:
+            list_path = os.path.join(tmp, 'segments.txt')
+            with open(list_path, 'w') as f:
+                f.writelines(f"file '{p}'\n" for p in seg_paths)
+            joined_path = os.path.join(tmp, 'joined.mp4')
+            _run([FFMPEG, '-v', 'error', '-y', '-f', 'concat', '-safe', '0', '-i', list_path,
+                  '-map', '0:v:0', '-c', 'copy', '-video_track_timescale', str(probe['time_base'].denominator),
+                  joined_path])
+            os.replace(joined_path, out_path)   # only complete clips ever appear under out_path
+    return segments
+
+
+def verify_clip(video_path, probe, start_frame, end_frame, clip_path, mode='smart'):
+    # (ok, problem): the clip must decode to exactly the annotated end - start + 1 frames, and a smart cut
+    # must match a full re-encode of the same range frame by frame
+    expected = end_frame - start_frame + 1
+    actual = count_frames(clip_path)
+    if end_frame >= len(probe['pts']):
+        return False, (f"truncated: {actual} decoded frames, expected {expected} "
+                       f"(the video ends at frame {len(probe['pts']) - 1})")
+    if actual != expected:
+        return False, f"{actual} decoded frames, expected {expected}"
+    if mode != 'smart':
+        return True, None
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(clip_path)), prefix='.verify_') as tmp:
+        reference_path = os.path.join(tmp, 'reference.mp4')
+        cut_clip(video_path, probe, start_frame, end_frame, reference_path, 'reencode')
+        psnr = min_psnr(clip_path, reference_path)
+    if not psnr >= VERIFY_MIN_PSNR:
+        return False, f"worst frame {psnr:.1f} dB against a re-encode"
+    return True, None
+
+
+def cut_clips(video_path, clips, mode='smart', verify=False, probe=None):
+    # clips: [(start_frame, end_frame, clip_filename)]; the video is probed once for all of them,
+    # or not at all when its cached ffprobe frame index (utils/frame_index.py) is passed in;
+    # an OpenCV-built index has no pts and keyframes and is probed again
+    if probe is None or probe['pts'] is None:
+        probe = probe_video(video_path)
+    print(f"[{os.path.basename(video_path)}] {len(probe['pts'])} frames, {len(probe['keyframes'])} keyframes, "
+          f"codec={probe['codec']}")
+    results = []
+    for start_frame, end_frame, clip_filename in clips:
+        try:
+            segments = cut_clip(video_path, probe, start_frame, end_frame, clip_filename, mode)
+        except (RuntimeError, ValueError) as e:
+            print(f"Failed: {clip_filename}: {e}")
+            results.append((clip_filename, False))
+            continue
+        copied = sum(last - first + 1 for kind, first, last in segments if kind == 'copy')
+        ok = True
+        if verify:
+            ok, problem = verify_clip(video_path, probe, start_frame, end_frame, clip_filename, mode)
+            if not ok and mode == 'smart' and end_frame < len(probe['pts']):   # re-encoding cannot fix a short video
+                print(f"[VERIFY] {clip_filename}: {problem}; re-encoding")
+                cut_clip(video_path, probe, start_frame, end_frame, clip_filename, 'reencode')
+                copied = 0
+                ok, problem = verify_clip(video_path, probe, start_frame, end_frame, clip_filename, 'reencode')
+            if not ok:
+                print(f"[VERIFY] {clip_filename}: {problem}")
+        print(f"Saved: {clip_filename} ({copied}/{end_frame - start_frame + 1} frames stream-copied)")
+        results.append((clip_filename, ok))
+    return results
@@ -1,7 +1,13 @@
+import csv
+import os
+
 import pandas as pd
-from tqdm import tqdm
 import numpy as np
 
+from utils import metrics
+from utils.resample import MAX_GAP, resample_track
+from utils.track_io import write_track
+
 
 TARGET_JOINTS_ORDERED = {
     0:  [('Hip','Bone')],
@@ -31,67 +37,151 @@ TARGET_JOINTS_ORDERED = {
 }
 
 
-def extract_3d_points_from_csv(input_path: str, output_path: str, total_frames: int = -1,skiprows: int = 1, offset: int = 0):
-    df = pd.read_csv(input_path, skiprows=skiprows, low_memory=False)
-    type_list = list(df.iloc[0].index)
-    header_row = df.iloc[0]
-    if offset < 0:
-        # raise ValueError("Offset must be a non-negative integer.")
-        print("Warning: Offset must be a non-negative integer.")
-        start = 4 + offset
-    else:
-        start = 4
-
-    if total_frames > 0:  # has been set
-        end = start + total_frames
-        if end > len(df):
-           print("Total frames exceed the number of available frames in the CSV file.")
-    else:
-        end = len(df)
+def resolve_joint_columns(type_list, header_row):
+    # 返回两个 (24, 3) 列索引数组；单 marker 关节两者相同，双 marker 关节取平均
+    name_to_cols = {}
+    for i, val in enumerate(header_row):
+        name_to_cols.setdefault(str(val)[13:], []).append(i)
 
-    df = df.iloc[start:end].reset_index(drop=True)
-
-    selected_columns = []
+    def find(name, kind):
+        cols = [i for i in name_to_cols.get(name, []) if str(type_list[i]).startswith(kind)][-3:]
+        if len(cols) != 3:
+            raise ValueError(f"Joint '{name}' ({kind}) has {len(cols)} position columns, expected 3.")
+        return cols
 
+    primary_cols = np.empty((24, 3), dtype=np.intp)
+    secondary_cols = np.empty((24, 3), dtype=np.intp)
     for joint_id in range(24):
         joint_defs = TARGET_JOINTS_ORDERED[joint_id]
-        if len(joint_defs) == 2:
-            cols_0 = [i for i, val in enumerate(header_row)
-                      if str(val)[13:] == joint_defs[0][0] and type_list[i].startswith(joint_defs[0][1])][-3:]
-            cols_1 = [i for i, val in enumerate(header_row)
-                      if str(val)[13:] == joint_defs[1][0] and type_list[i].startswith(joint_defs[1][1])][-3:]
-            selected_columns.append((cols_0, cols_1))
+        primary_cols[joint_id] = find(*joint_defs[0])
+        secondary_cols[joint_id] = find(*joint_defs[-1])
+    return primary_cols, secondary_cols
+
+
+HEADER_ROWS = 5      # Type, Name, ID, Position/Rotation, Frame/X/Y/Z
+CHUNK_ROWS = 5000
+
+
+def read_optitrack_header(f, skiprows=1):
+    # 从文件句柄读出多行表头，句柄停在第一行数据；空行与 pd.read_csv 一样跳过
+    for _ in range(skiprows):
+        f.readline()
+    rows = []
+    while len(rows) < HEADER_ROWS:
+        line = f.readline()
+        if not line:
+            raise ValueError(f"CSV header ended after {len(rows)} rows, expected {HEADER_ROWS}.")
+        if line.strip():
+            rows.append(next(csv.reader([line])))
+    return rows
+
+
+def time_column(header):
+    # Frame/X/Y/Z 行中 'Time (Seconds)' 所在列
+    for i, val in enumerate(header[HEADER_ROWS - 1]):
+        if str(val).startswith('Time'):
+            return i
+    raise ValueError("No 'Time' column in the CSV header.")
+
+
+def joint_gatherer(header):
+    # 表头只解析一次：返回需要读取的列，以及把这些列 gather 成 (N, 72) 的函数
+    type_list, header_row = header[0], header[1]
+    primary_cols, secondary_cols = resolve_joint_columns(type_list, header_row)
+    pair_joints = np.flatnonzero((primary_cols != secondary_cols).any(axis=1))
+    used_cols = np.unique(np.concatenate([primary_cols.ravel(), secondary_cols.ravel()]))
+    col_pos = np.searchsorted(used_cols, np.arange(used_cols.max() + 1))
+    primary_pos, secondary_pos = col_pos[primary_cols], col_pos[secondary_cols[pair_joints]]
+
+    def gather(block):
+        frames = block[:, primary_pos]                                # (N, 24, 3)
+        if len(pair_joints):  # 平均两个 marker
+            frames[:, pair_joints] = (frames[:, pair_joints] + block[:, secondary_pos]) / 2
+        return frames.reshape(len(frames), 24 * 3)
+    return used_cols, gather
+
+
+def read_joint_rows(f, used_cols, gather, nrows=None, t_col=None, chunk_rows=CHUNK_ROWS):
+    # 只读取用到的 ~78 列（和时间列），按块解析并 gather；返回 [(N, 72) 块], [时间块]
+    read_cols = used_cols.tolist() if t_col is None else sorted(set(used_cols.tolist()) | {t_col})
+    chunks, times = [], []
+    reader = pd.read_csv(f, header=None, usecols=read_cols, nrows=nrows, chunksize=chunk_rows, low_memory=False)
+    for chunk in reader:
+        if any(not pd.api.types.is_numeric_dtype(t) for t in chunk.dtypes):
+            chunk = chunk.apply(pd.to_numeric, errors='coerce')
+        chunks.append(gather(chunk[used_cols].to_numpy(dtype=np.float64)))
+        if t_col is not None:
+            times.append(chunk[t_col].to_numpy(dtype=np.float64))
+    return chunks, times
+
+
+def load_joint_track(input_path: str, skiprows: int = 1, chunk_rows: int = CHUNK_ROWS):
+    # 原始采样率下的全部数据行：(N, 72) 关节坐标和 (N,) Time 列（秒）
+    with open(input_path, 'r', encoding='utf-8', newline='') as f:
+        header = read_optitrack_header(f, skiprows)
+        used_cols, gather = joint_gatherer(header)
+        with metrics.span('csv_parse', file=os.path.basename(input_path)):
+            chunks, times = read_joint_rows(f, used_cols, gather, t_col=time_column(header), chunk_rows=chunk_rows)
+    if not chunks:
+        return np.empty((0, 24 * 3)), np.empty(0)
+    return np.concatenate(chunks), np.concatenate(times)
+
+
+def extract_3d_points_from_csv(input_path: str, output_path: str, total_frames: int = -1,skiprows: int = 1, offset: int = 0,
+                               chunk_rows: int = CHUNK_ROWS, frame_times=None, resample: str = 'linear',
+                               max_gap: float = MAX_GAP):
+    # frame_times: 视频每帧的时间戳（秒，见 utils/frame_index.py）。给定时按 Time 列把 120/240Hz 的 mocap
+    # 重采样到视频帧上，输出第 i 行即视频第 i 帧，total_frames 由 frame_times 决定
+    resampling = frame_times is not None
+    with open(input_path, 'r', encoding='utf-8', newline='') as f:
+        # --- 表头只解析一次，得到 24 个关节的列索引 ---
+        header = read_optitrack_header(f, skiprows)
+        used_cols, gather = joint_gatherer(header)
+
+        # 行号沿用旧的 df 下标：0-3 为表头行，数据从 4 开始
+        if offset < 0:
+            # raise ValueError("Offset must be a non-negative integer.")
+            print("Warning: Offset must be a non-negative integer.")
+            start = 4 + offset
         else:
-            cols = [i for i, val in enumerate(header_row)
-                    if str(val)[13:] == joint_defs[0][0] and type_list[i].startswith(joint_defs[0][1])][-3:]
-            selected_columns.append(cols)
-
-    final_data = []
-    for frame_idx, row in tqdm(df.iterrows(), total=len(df), desc="提取3D点"):
-        frame_data = []
-        try:
-            for cols in selected_columns:
-                if isinstance(cols, tuple):  # 平均两个 marker
-                    vals_0 = pd.to_numeric(row.iloc[cols[0]], errors='coerce').values
-                    vals_1 = pd.to_numeric(row.iloc[cols[1]], errors='coerce').values
-                    avg = (vals_0 + vals_1) / 2
-                    frame_data.extend(avg)
-                else:
-                    vals = pd.to_numeric(row.iloc[cols], errors='coerce').values
-                    frame_data.extend(vals)
-            final_data.append(frame_data)
-        except Exception as e:
-            print(f"\n❌ 第 {frame_idx} 帧出错：{e}")
-            # 可选：跳过这一帧，或填入 NaN
-            frame_data = [np.nan] * (24 * 3)
-            final_data.append(frame_data)
+            start = 4
+        # 与旧实现一致：落在范围内的表头行（Name/ID/Position/Frame）按数值转换后保留
+        chunks, times = [], []
+        header_used = header[1 + max(start, 0):HEADER_ROWS] if not resampling else []
+        if header_used:
+            values = [[row[i] if i < len(row) else '' for i in used_cols] for row in header_used]
+            block = pd.DataFrame(values).apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+            chunks.append(gather(block)[:total_frames if total_frames > 0 else None])
+        wanted = total_frames - len(header_used) if total_frames > 0 and not resampling else None
+
+        # --- 只读取用到的列，按块解析；重采样需要全部数据行和时间列 ---
+        if wanted is None or wanted > 0:
+            with metrics.span('csv_parse', file=os.path.basename(input_path)):
+                data_chunks, times = read_joint_rows(f, used_cols, gather, nrows=wanted,
+                                                     t_col=time_column(header) if resampling else None,
+                                                     chunk_rows=chunk_rows)
+            chunks += data_chunks
+
+    data = np.concatenate(chunks) if chunks else np.empty((0, 24 * 3))
+    if wanted is not None and len(data) < wanted:
+        print("Total frames exceed the number of available frames in the CSV file.")
+    if resampling:
+        times = np.concatenate(times) if times else np.empty(0)
+        frame_times = np.asarray(frame_times, dtype=np.float64)
+        if not len(times) or frame_times[-1] > np.nanmax(times):
+            print("Total frames exceed the number of available frames in the CSV file.")
+        data = resample_track(data, times, frame_times, method=resample, max_gap=max_gap)
+        total_frames = len(frame_times)
 
+    final_data = data
     if offset < 0:  # 补充视频前面几帧 丢失的数据
-        for i in range(abs(offset)):
-            final_data = [[np.nan] * (24 * 3)] + final_data
+        padding = np.full((abs(offset), 24 * 3), np.nan)
+        final_data = np.vstack([padding, final_data])
     columns = [f"{i}_{axis}" for i in range(24) for axis in ['x', 'y', 'z']]
     df_out = pd.DataFrame(final_data, columns=columns)
-    df_out.to_csv(output_path, index=False)
+    write_track(output_path, df_out, source=input_path, offset=offset, total_frames=total_frames,
+                resample=resample if resampling else None)
+    metrics.count('frames_extracted', len(df_out))
     print(f"\n 提取完成，结果已保存至 {output_path}")
 
 
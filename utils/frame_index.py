@@ -0,0 +1,122 @@
+import os
+import pickle
+
+import cv2
+import numpy as np
+
+from utils import metrics
+from utils.cache import CACHE_DIR, cache_file, write_cache
+from utils.clip_cut import probe_video
+
+FRAME_INDEX_VERSION = 2
+SEEK_BACKOFF = 32   # without keyframe info: frames to step back (then ×4 each retry) when a seek overshoots
+
+
+# --- Per-video frame index: exact frame count, per-frame pts and keyframe positions ---
+# built once with a packet-level ffprobe pass and cached by (size, mtime); videos are too big to hash
+def build_frame_index(video_path, exact=False):
+    try:
+        probe = probe_video(video_path)
+    except FileNotFoundError:
+        if exact:
+            raise
+        # no ffprobe on this machine: one OpenCV pass, exact count and timestamps but no keyframe info
+        return _build_index_with_opencv(video_path)
+    times = probe['pts'] * float(probe['time_base']) - float(probe['start_time'])
+    return dict(probe, num_frames=len(probe['pts']), times=times, source='ffprobe')
+
+
+def _build_index_with_opencv(video_path):
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open video {video_path}")
+    times = []
+    while cap.grab():
+        times.append(cap.get(cv2.CAP_PROP_POS_MSEC) / 1000)
+    cap.release()
+    return {'codec': None, 'pix_fmt': None, 'time_base': None, 'start_time': 0, 'pts': None,
+            'keyframes': None, 'num_frames': len(times),
+            'times': np.array(times, dtype=np.float64), 'source': 'opencv'}
+
+
+def load_frame_index(video_path, cache_dir=None, exact=False, cached_only=False):
+    # exact=True: the ffprobe index (pts + keyframes, as utils/clip_cut.py needs) is required; a cached
+    # OpenCV-built one is rebuilt, and without ffprobe this raises FileNotFoundError
+    # cached_only=True: None instead of building the index on a cache miss
+    cache_path = cache_file(video_path, 'frames', os.path.join(cache_dir or CACHE_DIR, 'frame_index'))
+    st = os.stat(video_path)
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'rb') as f:
+                entry = pickle.load(f)
+            if (entry.get('version'), entry['size'], entry['mtime_ns']) == \
+                    (FRAME_INDEX_VERSION, st.st_size, st.st_mtime_ns) and \
+                    (not exact or entry['index']['source'] == 'ffprobe'):
+                return entry['index']
+        except Exception as e:
+            print(f"[WARN] ignoring unreadable frame index {cache_path}: {e}")
+    if cached_only:
+        return None
+
+    with metrics.span('frame_index', file=os.path.basename(video_path)) as sp:
+        index = build_frame_index(video_path, exact)
+        sp.update(frames=index['num_frames'], source=index['source'])
+    write_cache(cache_path, {'version': FRAME_INDEX_VERSION, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns,
+                             'index': index})
+    return index
+
+
+def frame_at_time(index, seconds):
+    # frame shown at `seconds` (as reported by CAP_PROP_POS_MSEC), or None if it matches no frame
+    times = index['times']
+    i = int(np.searchsorted(times, seconds))
+    near = [j for j in (i - 1, i) if 0 <= j < len(times)]
+    if not near:
+        return None
+    j = min(near, key=lambda j: abs(times[j] - seconds))
+    # within half the gap to the neighbouring frames
+    gaps = np.diff(times[max(j - 1, 0):j + 2])
+    tolerance = gaps.min() / 2 if len(gaps) else 1e-3
+    return j if abs(times[j] - seconds) <= tolerance else None
+
+
+def keyframe_before(index, frame):
+    keys = index['keyframes']
+    k = np.searchsorted(keys, frame, side='right') - 1
+    return int(keys[k]) if k >= 0 else 0
+
+
+def _seek_starts(index, frame):
+    # where to seek before grabbing forward to `frame`, nearest first, ending at 0
+    if index['keyframes'] is None:
+        # no keyframe info (OpenCV-built index): OpenCV's own frame-number seek first, then further back
+        starts, step = [max(frame, 0)], SEEK_BACKOFF
+        while starts[-1] > 0:
+            starts.append(max(frame - step, 0))
+            step *= 4
+        return starts
+    starts = [keyframe_before(index, frame)]
+    while starts[-1] > 0:
+        starts.append(keyframe_before(index, starts[-1] - 1))
+    return starts
+
+
+# --- Exact seek: after this, the last grabbed frame is `frame` (read it with cap.retrieve()) ---
+def seek_frame(cap, index, frame):
+    if frame >= index['num_frames']:
+        return False
+    # seek, check where OpenCV really landed (CAP_PROP_POS_MSEC against the index times) and grab
+    # forward from there; fall back to earlier start points (finally frame 0) if it overshot
+    for k in _seek_starts(index, frame):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, k)
+        if not cap.grab():
+            continue
+        pos = frame_at_time(index, cap.get(cv2.CAP_PROP_POS_MSEC) / 1000)
+        if pos is None or pos > frame:
+            continue
+        while pos < frame:
+            if not cap.grab():
+                return False
+            pos += 1
+        return True
+    return False
@@ -0,0 +1,84 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from utils.annotations import file_sha256
+
+LEDGER_NAME = 'ledger.sqlite'
+
+
+def partial_path(path):
+    # keeps the extension, so writers that pick the container from it (cv2.VideoWriter, np.save) still work
+    root, ext = os.path.splitext(path)
+    return f"{root}.partial-{os.getpid()}{ext}"
+
+
+@contextmanager
+def atomic_output(path):
+    # write to partial_path(path) and rename on success, so an interrupted run never leaves half a file
+    tmp_path = partial_path(path)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+# --- Job ledger: remembers the inputs each output was built from ---
+class JobLedger:
+    def __init__(self, output_dir, name=LEDGER_NAME):
+        os.makedirs(output_dir, exist_ok=True)
+        self.path = os.path.join(output_dir, name)
+        # several batch workers may share one ledger, so wait on locks instead of failing
+        self.conn = sqlite3.connect(self.path, timeout=60)
+        with self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS files ("
+                              "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, sha256 TEXT)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS outputs ("
+                              "path TEXT PRIMARY KEY, fingerprint TEXT, inputs TEXT, updated_at REAL)")
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def file_digest(self, path, content=True):
+        # content=True: sha256, recomputed only when size/mtime change; content=False: size+mtime only (large videos)
+        st = os.stat(path)
+        if not content:
+            return f"stat:{st.st_size}:{st.st_mtime_ns}"
+        key = os.path.abspath(path)
+        row = self.conn.execute("SELECT size, mtime_ns, sha256 FROM files WHERE path = ?", (key,)).fetchone()
+        if row and (row[0], row[1]) == (st.st_size, st.st_mtime_ns):
+            return row[2]
+        digest = file_sha256(path)
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                              (key, st.st_size, st.st_mtime_ns, digest))
+        return digest
+
+    @staticmethod
+    def fingerprint(**inputs):
+        return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def is_current(self, output_path, fingerprint):
+        if not os.path.exists(output_path):
+            return False
+        row = self.conn.execute("SELECT fingerprint FROM outputs WHERE path = ?",
+                                (os.path.abspath(output_path),)).fetchone()
+        return row is not None and row[0] == fingerprint
+
+    def record(self, output_path, fingerprint, **inputs):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?)",
+                              (os.path.abspath(output_path), fingerprint,
+                               json.dumps(inputs, sort_keys=True, default=str), time.time()))
@@ -0,0 +1,63 @@
+import json
+import os
+from functools import lru_cache
+
+from utils.track_io import load_track
+
+# One JSON object per slice; 'source' is stored relative to the manifest's folder when possible
+MANIFEST_FIELDS = ['name', 'source', 'video', 'action', 'row', 'rep', 'start', 'end']
+
+
+def manifest_entry(name, source, video, action, row, rep, start, end):
+    # start/end are the offset-corrected frame range, end exclusive (same as csv_data.iloc[start:end])
+    return {'name': name, 'source': source, 'video': video, 'action': str(action),
+            'row': int(row), 'rep': int(rep), 'start': int(start), 'end': int(end)}
+
+
+def write_manifest(manifest_path, entries):
+    # merge into an existing manifest: entries of the same source track are replaced, others are kept
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_path))
+    entries = [dict(e, source=_relative_source(e['source'], manifest_dir)) for e in entries]
+    new_sources = {e['source'] for e in entries}
+
+    kept = []
+    if os.path.exists(manifest_path):
+        kept = [e for e in read_manifest(manifest_path, resolve=False) if e['source'] not in new_sources]
+
+    os.makedirs(manifest_dir, exist_ok=True)
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for e in sorted(kept + entries, key=lambda e: (e['source'], e['row'], e['rep'])):
+            f.write(json.dumps({k: e[k] for k in MANIFEST_FIELDS}, ensure_ascii=False) + '\n')
+    os.replace(tmp_path, manifest_path)
+    return len(kept) + len(entries)
+
+
+def read_manifest(manifest_path, resolve=True):
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_path))
+    entries = []
+    with open(manifest_path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                if resolve and not os.path.isabs(entry['source']):
+                    entry['source'] = os.path.normpath(os.path.join(manifest_dir, entry['source']))
+                entries.append(entry)
+    return entries
+
+
+def _relative_source(source, manifest_dir):
+    try:
+        return os.path.relpath(os.path.abspath(source), manifest_dir)
+    except ValueError:  # different drive on Windows
+        return os.path.abspath(source)
+
+
+@lru_cache(maxsize=32)
+def _open_track(source):
+    return load_track(source, mmap=True)
+
+
+def load_slice(entry):
+    # (frames, 24, 3); a view into the memory-mapped track for .npy sources
+    return _open_track(entry['source'])[entry['start']:entry['end']]
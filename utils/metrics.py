@@ -0,0 +1,195 @@
+import atexit
+import cProfile
+import json
+import multiprocessing.util
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+
+# --- Run metrics: timing spans, counters and optional profiles, appended as JSON lines ---
+# Off unless DASE_METRICS names a .jsonl file; every process of a run (pool workers included) appends to it.
+# DASE_PROFILE=cprofile,tracemalloc additionally profiles each process that calls init_process();
+# cProfile dumps go next to the metrics file as <role>-<pid>.prof.
+METRICS_ENV = 'DASE_METRICS'
+PROFILE_ENV = 'DASE_PROFILE'
+RUN_ENV = 'DASE_RUN_ID'
+PROFILE_TOP = 25
+
+_lock = threading.Lock()
+_state = {'pid': None, 'file': None, 'counters': defaultdict(int), 'role': None, 'started': None,
+          'profiler': None, 'tracemalloc': False, 'finished': False}
+
+
+def enabled():
+    return bool(os.environ.get(METRICS_ENV))
+
+
+def _own_state():
+    # a forked worker inherits the parent's state: start over with its own file handle and counters
+    if _state['pid'] != os.getpid():
+        if _state['profiler'] is not None:
+            _state['profiler'].disable()   # the parent's profiler would otherwise keep running in the child
+        _state.update(pid=os.getpid(), file=None, counters=defaultdict(int), role=None, started=None,
+                      profiler=None, tracemalloc=False, finished=False)
+
+
+def _emit(record):
+    with _lock:
+        _own_state()
+        if _state['file'] is None:
+            path = os.environ[METRICS_ENV]
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            _state['file'] = open(path, 'a', encoding='utf-8', buffering=1)
+        line = {'ts': round(time.time(), 3), 'run': os.environ.get(RUN_ENV), 'pid': os.getpid(),
+                'role': _state['role'], **record}
+        _state['file'].write(json.dumps(line, ensure_ascii=False, default=str) + '\n')
+
+
+def _ensure_process():
+    # library code used without init_process() still gets its counters flushed at exit
+    if _state['pid'] != os.getpid() or _state['started'] is None:
+        init_process(os.path.splitext(os.path.basename(sys.argv[0] or 'python'))[0] or 'python')
+
+
+@contextmanager
+def span(name, **fields):
+    # with span('csv_parse', path=p) as sp: ...; sp['rows'] = n  adds fields once the block is known
+    if not enabled():
+        yield {}
+        return
+    _ensure_process()
+    fields = dict(fields)
+    t0 = time.perf_counter()
+    ok = False
+    try:
+        yield fields
+        ok = True
+    finally:
+        _emit({'type': 'span', 'name': name, 'seconds': round(time.perf_counter() - t0, 6), 'ok': ok, **fields})
+
+
+def count(name, n=1):
+    # counters are summed in memory and written once per process (flush / process exit)
+    if not enabled() or not n:
+        return
+    _ensure_process()
+    with _lock:
+        _own_state()
+        _state['counters'][name] += int(n)
+
+
+def record_stages(name, stats):
+    # utils.video_pipeline stats: one span per stage, plus the wall time of the whole pipeline
+    if not enabled():
+        return
+    _ensure_process()
+    for stage in ('decode', 'process', 'encode'):
+        _emit({'type': 'span', 'name': f"{name}.{stage}", 'seconds': round(stats[stage], 6), 'ok': True,
+               'frames': stats['frames']})
+    _emit({'type': 'span', 'name': name, 'seconds': round(stats['wall'], 6), 'ok': True, 'frames': stats['frames']})
+
+
+def flush():
+    with _lock:
+        _own_state()
+        counters = dict(_state['counters'])
+        _state['counters'].clear()
+    for name, value in sorted(counters.items()):
+        _emit({'type': 'counter', 'name': name, 'value': value})
+
+
+# --- Per-process setup: call from every script's __main__ and every pool initializer ---
+def init_process(role):
+    if not enabled():
+        return
+    _own_state()
+    if _state['started'] is not None:
+        _state['role'] = role
+        return
+    os.environ.setdefault(RUN_ENV, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}")   # inherited by workers
+    _state['role'] = role
+    _state['started'] = time.perf_counter()
+    profile = {p.strip() for p in os.environ.get(PROFILE_ENV, '').lower().split(',') if p.strip()}
+    if 'tracemalloc' in profile:
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()   # tracing inherited through fork: peak from here on
+        else:
+            tracemalloc.start()
+        _state['tracemalloc'] = True
+    if 'cprofile' in profile:
+        _state['profiler'] = cProfile.Profile()
+        _state['profiler'].enable()
+    _emit({'type': 'process', 'event': 'start', 'argv': sys.argv})
+    # pool workers leave through os._exit, which skips atexit but still runs multiprocessing finalizers
+    atexit.register(_finish)
+    multiprocessing.util.Finalize(None, _finish, exitpriority=100)
+
+
+def _finish():
+    _own_state()
+    if _state['finished'] or _state['started'] is None:
+        return
+    _state['finished'] = True
+    profiler = _state['profiler']
+    if profiler is not None:
+        profiler.disable()
+        prof_path = os.path.join(os.path.dirname(os.path.abspath(os.environ[METRICS_ENV])),
+                                 f"{_state['role']}-{os.getpid()}.prof")
+        profiler.dump_stats(prof_path)
+        stats = pstats.Stats(profiler).stats
+        top = sorted(stats.items(), key=lambda kv: kv[1][3], reverse=True)[:PROFILE_TOP]
+        _emit({'type': 'profile', 'path': prof_path,
+               'top': [{'function': f"{os.path.basename(f)}:{line}({fn})", 'calls': nc,
+                        'tottime': round(tt, 4), 'cumtime': round(ct, 4)}
+                       for (f, line, fn), (_, nc, tt, ct, _) in top]})
+    if _state['tracemalloc']:
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        _emit({'type': 'tracemalloc', 'peak_mb': round(peak / (1 << 20), 2),
+               'top': [{'where': str(s.traceback[0]), 'size_mb': round(s.size / (1 << 20), 3), 'count': s.count}
+                       for s in snapshot.statistics('lineno')[:PROFILE_TOP]]})
+    flush()
+    _emit({'type': 'process', 'event': 'end', 'seconds': round(time.perf_counter() - _state['started'], 3)})
+    with _lock:
+        if _state['file'] is not None:
+            _state['file'].close()
+            _state['file'] = None
+
+
+# --- Where did the time go: total / mean seconds per span and summed counters over a metrics log ---
+def summarize(path, run=None):
+    spans = defaultdict(list)
+    counters = defaultdict(int)
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            if run is not None and record.get('run') != run:
+                continue
+            if record['type'] == 'span':
+                spans[record['name']].append(record['seconds'])
+            elif record['type'] == 'counter':
+                counters[record['name']] += record['value']
+    rows = sorted(((name, len(s), sum(s), max(s)) for name, s in spans.items()), key=lambda r: -r[2])
+    print(f"{'span':36s} {'count':>7s} {'total s':>10s} {'mean s':>9s} {'max s':>9s}")
+    for name, n, total, longest in rows:
+        print(f"{name:36s} {n:7d} {total:10.2f} {total / n:9.4f} {longest:9.3f}")
+    if counters:
+        print()
+        for name, value in sorted(counters.items()):
+            print(f"{name:36s} {value:>12d}")
+    return rows, dict(counters)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Summarize a DASE_METRICS log.")
+    parser.add_argument('path')
+    parser.add_argument('--run', help="only this run id")
+    args = parser.parse_args()
+    summarize(args.path, args.run)
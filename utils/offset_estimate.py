@@ -0,0 +1,110 @@
+import cv2
+import numpy as np
+
+from utils.projection import project_points
+from utils.video_pipeline import run_pipeline
+
+ENERGY_WIDTH = 64      # frames are downscaled to this width before differencing
+MAX_LAG = 300          # offsets searched in [-MAX_LAG, MAX_LAG] track rows
+MIN_OVERLAP = 0.5      # a lag needs at least this fraction of the shorter signal to overlap
+PEAK_EXCLUSION = 15    # rows around the peak ignored when looking for the runner-up
+
+
+# --- Video side: mean absolute difference of consecutive downscaled grey frames, one decode pass ---
+def video_motion_energy(video_path, width=ENERGY_WIDTH, queue_depth=8):
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open video {video_path}")
+
+    def decode():
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                return
+            yield frame
+
+    prev = [None]
+
+    def process(frame):
+        h, w = frame.shape[:2]
+        small = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (width, max(1, round(h * width / w))),
+                           interpolation=cv2.INTER_AREA).astype(np.float32)
+        value = np.nan if prev[0] is None else float(np.abs(small - prev[0]).mean())
+        prev[0] = small
+        return value
+
+    energy = []
+    try:
+        run_pipeline(decode(), process, energy.append, queue_depth=queue_depth, name='offset.motion_energy')
+    finally:
+        cap.release()
+    return np.array(energy, dtype=np.float64)
+
+
+# --- Track side: joint speed, in pixels when a camera projection is given, else in 3D ---
+def track_motion_signal(track, proj=None):
+    points = np.asarray(track, dtype=np.float64).reshape(len(track), -1, 3)
+    if proj is not None:
+        uv, valid = project_points(points, proj)
+        points = np.where(valid[..., None], uv.astype(np.float64), np.nan)
+    speed = np.linalg.norm(np.diff(points, axis=0), axis=-1)          # (F-1, J), NaN where a joint is missing
+    return np.concatenate([[np.nan], _nanmean_rows(speed)])
+
+
+def _nanmean_rows(values):
+    valid = np.isfinite(values)
+    counts = valid.sum(axis=1)
+    sums = np.where(valid, values, 0.0).sum(axis=1)
+    return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+
+def _robust_normalize(signal):
+    # median/MAD z-score, clipped so a few glitches (cuts, marker swaps) do not dominate the correlation
+    signal = np.asarray(signal, dtype=np.float64)
+    valid = np.isfinite(signal)
+    if not valid.any():
+        return signal
+    med = np.median(signal[valid])
+    mad = np.median(np.abs(signal[valid] - med)) * 1.4826
+    return np.clip((signal - med) / (mad if mad > 0 else 1.0), -5, 5)
+
+
+# --- NaN-aware normalised cross-correlation over a bounded lag window, all by FFT ---
+def normalized_cross_correlation(a, b, max_lag=MAX_LAG, min_overlap=MIN_OVERLAP):
+    # r[k] = Pearson correlation of a[t] and b[t + k] over the t where both are valid, k in [-max_lag, max_lag]
+    a, b = np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64)
+    ma, mb = np.isfinite(a).astype(np.float64), np.isfinite(b).astype(np.float64)
+    a, b = np.where(ma > 0, a, 0.0), np.where(mb > 0, b, 0.0)
+    nfft = 1 << int(np.ceil(np.log2(max(len(a) + len(b) - 1, 1))))
+
+    fa, fa2, fma = (np.conj(np.fft.rfft(x, nfft)) for x in (a, a * a, ma))
+    fb, fb2, fmb = (np.fft.rfft(x, nfft) for x in (b, b * b, mb))
+
+    def xcorr(fx, fy):
+        return np.fft.irfft(fx * fy, nfft)
+
+    lags = np.arange(-max_lag, max_lag + 1)
+    pick = lags % nfft
+    n = np.rint(xcorr(fma, fmb)[pick])
+    s_ab, s_a, s_b = xcorr(fa, fb)[pick], xcorr(fa, fmb)[pick], xcorr(fma, fb)[pick]
+    s_aa, s_bb = xcorr(fa2, fmb)[pick], xcorr(fma, fb2)[pick]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = s_ab - s_a * s_b / n
+        var = (s_aa - s_a ** 2 / n) * (s_bb - s_b ** 2 / n)
+        r = cov / np.sqrt(var)
+    r[(n < min_overlap * min(ma.sum(), mb.sum())) | ~(var > 0)] = np.nan
+    return lags, r
+
+
+def estimate_offset(video_signal, track_signal, max_lag=MAX_LAG, min_overlap=MIN_OVERLAP):
+    # offset in the slice_csv sense: track row (video frame + offset) matches video frame
+    # returns (offset, confidence = peak correlation, margin = peak minus best correlation away from it)
+    lags, r = normalized_cross_correlation(_robust_normalize(video_signal), _robust_normalize(track_signal),
+                                           max_lag, min_overlap)
+    if not np.isfinite(r).any():
+        return None, 0.0, 0.0
+    best = int(np.nanargmax(r))
+    away = np.abs(lags - lags[best]) > PEAK_EXCLUSION
+    runner_up = np.nanmax(r[away]) if np.isfinite(r[away]).any() else 0.0
+    return int(lags[best]), float(r[best]), float(r[best] - runner_up)
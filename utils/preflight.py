@@ -0,0 +1,111 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from utils import metrics
+from utils.extract_24_keypoint_from_csv import joint_gatherer, read_optitrack_header, time_column
+from utils.frame_index import load_frame_index
+
+PROBE_WORKERS = 16   # probes wait on ffprobe and network storage, not on the GIL
+
+
+# --- Pre-flight: every offset-sheet row checked once, concurrently, before any extraction starts ---
+def list_dirs(paths):
+    # one listing per directory instead of one stat per file; a missing directory lists as empty
+    def listing(path):
+        try:
+            with os.scandir(path) as it:
+                return path, {entry.name for entry in it}
+        except OSError:
+            return path, set()
+    with ThreadPoolExecutor(max_workers=PROBE_WORKERS) as pool:
+        return dict(pool.map(listing, set(paths)))
+
+
+def exists_in(listings, path):
+    return os.path.basename(path) in listings.get(os.path.dirname(path), ())
+
+
+def header_frame_count(video_path):
+    # frame count from the container header (mp4 sample table): reads the header only, not the stream
+    cap = cv2.VideoCapture(video_path)
+    try:
+        return int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) if cap.isOpened() else -1
+    finally:
+        cap.release()
+
+
+def probe_frame_count(video_path):
+    # (frames, source, error): the exact count when the frame index (utils/frame_index.py) is already cached,
+    # otherwise the container header, which only shows the video is readable (it is wrong for VFR or badly
+    # muxed mp4s); the full index is only built here when the header has no count
+    try:
+        index = load_frame_index(video_path, cached_only=True)
+        if index is not None:
+            return index['num_frames'], 'index', None
+        frames = header_frame_count(video_path)
+        if frames > 0:
+            return frames, 'header', None
+        return load_frame_index(video_path)['num_frames'], 'index', None
+    except Exception as e:
+        return -1, None, f"{type(e).__name__}: {e}"
+
+
+def check_csv_header(csv_path, skiprows=1, need_time=False):
+    # only the header rows are read: all 24 joints must resolve, and 'Time' must exist when resampling
+    try:
+        with open(csv_path, 'r', encoding='utf-8', newline='') as f:
+            header = read_optitrack_header(f, skiprows)
+        joint_gatherer(header)
+        if need_time:
+            time_column(header)
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+    return None
+
+
+def preflight(offset_table, video_base_path, csv_base_path, skiprows=1, need_time=False, workers=PROBE_WORKERS):
+    # returns (plan, problems): plan has one entry per usable row, with paths and total_frames, the exact video
+    # frame count when the frame index was cached, else None: the generation step then takes it from the index
+    # (sync_all_video.get_video_frame_count), lazily and only for the tracks it really extracts;
+    # problems are (kind, path, detail) with kind in 'video_missing', 'csv_missing', 'video_unreadable', 'csv_header'
+    with metrics.span('preflight', rows=len(offset_table)) as sp:
+        rows = []
+        for row in offset_table.itertuples(index=False):
+            rows.append({'session': row.session, 'video_name': row.video_name, 'csv_name': row.csv_name,
+                         'offset': row.offset,
+                         'video_path': os.path.join(video_base_path, row.session, row.video_name),
+                         'input_csv_path': os.path.join(csv_base_path, row.csv_name)})
+        listings = list_dirs([os.path.dirname(r[k]) for r in rows for k in ('video_path', 'input_csv_path')])
+
+        missing = {}   # path -> 'video_missing' / 'csv_missing'
+        videos, csvs = set(), set()
+        for r in rows:
+            for key, kind, found in (('video_path', 'video_missing', videos), ('input_csv_path', 'csv_missing', csvs)):
+                if exists_in(listings, r[key]):
+                    found.add(r[key])
+                else:
+                    missing[r[key]] = kind
+        problems = [(kind, path, None) for path, kind in missing.items()]
+
+        # each distinct file is probed once, however many rows point at it
+        videos, csvs = sorted(videos), sorted(csvs)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            frame_counts = dict(zip(videos, pool.map(probe_frame_count, videos)))
+            headers = dict(zip(csvs, pool.map(lambda p: check_csv_header(p, skiprows, need_time), csvs)))
+        for path, (frames, _, error) in frame_counts.items():
+            if frames <= 0:
+                problems.append(('video_unreadable', path, error or f"{frames} frames"))
+        for path, error in headers.items():
+            if error:
+                problems.append(('csv_header', path, error))
+
+        bad = {path for _, path, _ in problems}
+        plan = []
+        for r in rows:
+            if r['video_path'] not in bad and r['input_csv_path'] not in bad:
+                frames, source, _ = frame_counts[r['video_path']]
+                plan.append(dict(r, total_frames=frames if source == 'index' else None, frames_from=source))
+        sp.update(planned=len(plan), problems=len(problems), videos=len(videos), csvs=len(csvs))
+    return plan, problems
@@ -0,0 +1,69 @@
+import json
+
+import numpy as np
+
+INT32_LIMIT = np.iinfo(np.int32).max
+# camera angle suffix -> calibration file in camera_data/; the R camera is not calibrated
+CAMERA_FILES = {'L': 'extrinsics_left.json', 'C': 'extrinsics_middle.json'}
+
+
+def load_camera(camera_json):
+    # load camera intrinsics+extrinsics from camera_data/extrinsics_*.json
+    with open(camera_json, 'r') as f:
+        cam = json.load(f)
+    K  = np.array(cam['camera_matrix'])       # 3×3
+    P4 = np.array(cam['best_extrinsic'])      # 3×4
+    return K, P4
+
+
+def load_dist_coeffs(camera_json):
+    # OpenCV (k1, k2, p1, p2, k3) distortion coefficients of the same calibration
+    with open(camera_json, 'r') as f:
+        cam = json.load(f)
+    return np.array(cam['dist_coeffs'], dtype=np.float64).ravel()
+
+
+def projection_matrix(K, P4):
+    return K.dot(P4)                          # full 3×4 projection
+
+
+def project_points(points, proj):
+    # points: (frames, joints, 3) -> pixel coords (frames, joints, 2) int32 and a (frames, joints) valid mask
+    points = np.asarray(points, dtype=np.float64)
+    homog = np.concatenate([points, np.ones(points.shape[:-1] + (1,))], axis=-1)   # (F, J, 4)
+    x2d = homog @ proj.T                                                           # (F, J, 3)
+    w = x2d[..., 2]
+
+    # NaN joints and points on/behind the camera plane are masked out
+    valid = np.isfinite(x2d).all(axis=-1) & (w > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        uv = x2d[..., :2] / w[..., None]
+    valid &= (np.abs(uv) < INT32_LIMIT).all(axis=-1)
+    # truncate towards zero like int(), invalid entries are left at 0
+    uv = np.where(valid[..., None], np.trunc(uv), 0).astype(np.int32)
+    return uv, valid
+
+
+def project_points_distorted(points, K, P4, dist):
+    # same as project_points, but through the lens model: (F, J, 3) -> (F, J, 2) int32 pixels + valid mask
+    points = np.asarray(points, dtype=np.float64)
+    k1, k2, p1, p2, k3 = np.pad(np.asarray(dist, dtype=np.float64).ravel(), (0, 5))[:5]
+    homog = np.concatenate([points, np.ones(points.shape[:-1] + (1,))], axis=-1)
+    cam = homog @ np.asarray(P4, dtype=np.float64).T                              # camera coordinates (F, J, 3)
+    z = cam[..., 2]
+    valid = np.isfinite(cam).all(axis=-1) & (z > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x, y = cam[..., 0] / z, cam[..., 1] / z
+    r2 = x * x + y * y
+    radial = 1 + k1 * r2 + k2 * r2 ** 2 + k3 * r2 ** 3
+    xd = x * radial + 2 * p1 * x * y + p2 * (r2 + 2 * x * x)
+    yd = y * radial + p1 * (r2 + 2 * y * y) + 2 * p2 * x * y
+    # far outside the calibrated field of view the polynomial folds back onto the image; drop those points
+    valid &= (1 + 3 * k1 * r2 + 5 * k2 * r2 ** 2 + 7 * k3 * r2 ** 3) > 0
+
+    u = K[0, 0] * xd + K[0, 1] * yd + K[0, 2]
+    v = K[1, 1] * yd + K[1, 2]
+    uv = np.stack([u, v], axis=-1)
+    valid &= np.isfinite(uv).all(axis=-1) & (np.abs(uv) < INT32_LIMIT).all(axis=-1)
+    uv = np.where(valid[..., None], np.trunc(uv), 0).astype(np.int32)
+    return uv, valid
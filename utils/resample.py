@@ -0,0 +1,65 @@
+import numpy as np
+
+RESAMPLE_METHODS = ('nearest', 'linear')
+MAX_GAP = 0.1   # seconds; occlusion gaps longer than this stay NaN instead of being bridged
+
+
+# --- Resample a mocap track onto video frame timestamps ---
+# values: (N, ...) samples at src_times (N,) seconds; returns (M, ...) at dst_times (M,).
+# Everything is computed as whole-array operations, no per-frame Python loop.
+def resample_track(values, src_times, dst_times, method='linear', max_gap=MAX_GAP):
+    if method not in RESAMPLE_METHODS:
+        raise ValueError(f"Unknown resample method '{method}', expected one of {RESAMPLE_METHODS}")
+    values = np.asarray(values, dtype=np.float64)
+    src_times = np.asarray(src_times, dtype=np.float64)
+    dst_times = np.asarray(dst_times, dtype=np.float64)
+    n = len(src_times)
+    out_shape = (len(dst_times),) + values.shape[1:]
+    if n == 0:
+        return np.full(out_shape, np.nan)
+
+    # samples keep their own rows; a sample time that is NaN (bad row) is dropped
+    keep = np.isfinite(src_times)
+    if not keep.all():
+        values, src_times = values[keep], src_times[keep]
+        n = len(src_times)
+    period = np.median(np.diff(src_times)) if n > 1 else 0.0
+    inside = (dst_times >= src_times[0] - period / 2) & (dst_times <= src_times[-1] + period / 2)
+
+    if method == 'nearest':
+        if n == 1:
+            idx = np.zeros(len(dst_times), dtype=np.intp)
+        else:
+            right = np.clip(np.searchsorted(src_times, dst_times), 1, n - 1)
+            left = right - 1
+            idx = np.where(dst_times - src_times[left] <= src_times[right] - dst_times, left, right)
+        out = values[idx]
+        out[~inside] = np.nan
+        return out
+
+    # linear: interpolate each joint between the nearest *valid* samples on either side,
+    # so short occlusions are bridged; a joint is valid when all of its coordinates are finite
+    flat = values.reshape(n, -1, 3) if values.ndim > 1 and values.shape[-1] % 3 == 0 else values.reshape(n, -1, 1)
+    valid = np.isfinite(flat).all(axis=-1)                                   # (N, J)
+    rows = np.arange(n)[:, None]
+    prev_valid = np.maximum.accumulate(np.where(valid, rows, -1), axis=0)    # last valid sample at or before i
+    next_valid = np.minimum.accumulate(np.where(valid, rows, n)[::-1], axis=0)[::-1]   # first valid at or after i
+
+    i = np.clip(np.searchsorted(src_times, dst_times, side='right') - 1, 0, n - 1)   # sample at or before t
+    lo = prev_valid[i]                                                       # (M, J)
+    hi = next_valid[np.minimum(i + 1, n - 1)]
+    exact = (lo == i[:, None]) & (src_times[i] == dst_times)[:, None]
+    hi = np.where(exact, lo, hi)
+
+    ok = (lo >= 0) & (hi < n) & inside[:, None]
+    lo_c, hi_c = np.clip(lo, 0, n - 1), np.clip(hi, 0, n - 1)
+    t_lo, t_hi = src_times[lo_c], src_times[hi_c]
+    if max_gap is not None:
+        ok &= (t_hi - t_lo) <= max_gap + period / 2
+    span = np.where(t_hi > t_lo, t_hi - t_lo, 1.0)
+    w = np.clip(np.where(t_hi > t_lo, (dst_times[:, None] - t_lo) / span, 0.0), 0.0, 1.0)[..., None]
+
+    joints = np.arange(flat.shape[1])
+    out = flat[lo_c, joints] * (1 - w) + flat[hi_c, joints] * w
+    out[~ok] = np.nan
+    return out.reshape(out_shape)
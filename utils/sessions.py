@@ -0,0 +1,58 @@
+import os
+import re
+
+# Excel sheet name in DataCollection_XX.xlsx -> game name used in video / csv file names
+GAME_SHEETS = {
+    'Gaming Museum':           'museum',
+    'BowlingVR':               'bowling',
+    'Gallery of H.K. History': 'gallery',
+    'Hong Kong Time Travel':   'travel',
+    'Boss Fight':              'boss',
+    'Candy Shooter':           'candy',
+}
+SHEET_BY_GAME = {game: sheet for sheet, game in GAME_SHEETS.items()}
+
+ANGLES = ('L', 'C', 'R')
+
+# slice / clip file stem: {code}_{game}_{angle}_{action}_row{row}_rep{rep}
+SLICE_STEM = re.compile(r"([^_]+)_([^_]+)_([^_]+)_(.+?)_row([0-9]+)_rep([0-9]+)$")
+
+
+def build_sheet_video_map(video_code, video_suffix):
+    return {sheet: f'{video_code}_{game}_{video_suffix}.mp4' for sheet, game in GAME_SHEETS.items()}
+
+
+def build_sheet_csv_map(video_code, video_suffix, track_ext='csv'):
+    return {sheet: f'{video_code}_{game}_{video_suffix}_3d.{track_ext}' for sheet, game in GAME_SHEETS.items()}
+
+
+def parse_video_name(video_name):
+    # '13_museum_C.mp4' -> ('13', 'museum', 'C')
+    root = os.path.splitext(os.path.basename(video_name))[0]
+    vid_code, vid_name, vid_suffix = root.split('_')
+    return vid_code, vid_name, vid_suffix
+
+
+def parse_slice_name(slice_name):
+    # '13_museum_C_jump_row4_rep2.npy' -> {'code': '13', 'game': 'museum', 'angle': 'C', 'action': 'jump', 'row': 4, 'rep': 2}
+    root = os.path.splitext(os.path.basename(slice_name))[0]
+    m = SLICE_STEM.match(root)
+    if not m:
+        raise ValueError(f"Unrecognized slice name: {slice_name}")
+    code, game, angle, action, row, rep = m.groups()
+    return {'code': code, 'game': game, 'angle': angle, 'action': action, 'row': int(row), 'rep': int(rep)}
+
+
+def session_code(session_folder):
+    # offset sheet / folder name '25.1.17_13' -> '13'
+    return session_folder.rsplit('_', 1)[-1]
+
+
+def find_data_collection_files(excel_folder):
+    # {'01': '.../DataCollection_01.xlsx', ...}
+    files = {}
+    for name in sorted(os.listdir(excel_folder)):
+        m = re.match(r"DataCollection_([0-9]+)\.xlsx$", name)
+        if m:
+            files[m.group(1)] = os.path.join(excel_folder, name)
+    return files
@@ -0,0 +1,164 @@
+import io
+import json
+import os
+import tarfile
+import time
+
+import numpy as np
+
+from utils.ledger import atomic_output, partial_path
+
+SHARD_SIZE = 1 << 30                    # bytes per shard before the next one is started
+SHARD_NAME = "{prefix}-{index:05d}.tar"
+INDEX_SUFFIX = '.idx.json'              # next to every shard: byte range of each member, plus record metadata
+
+
+# --- Shards are plain tar files in WebDataset layout: the members of one record share a key ---
+# (<key>.json metadata, <key>.npy keypoints, <key>.mp4 clip), so any WebDataset / tar reader can stream them;
+# the index makes every member readable with one seek + read, without scanning the tar
+def index_path(shard_path):
+    return shard_path + INDEX_SUFFIX
+
+
+def encode_member(ext, value):
+    if ext == 'npy':
+        buf = io.BytesIO()
+        np.save(buf, np.asarray(value, dtype=np.float32))
+        return buf.getvalue()
+    if ext == 'json':
+        return json.dumps(value, ensure_ascii=False, default=str).encode('utf-8')
+    return value
+
+
+def decode_member(ext, data):
+    if ext == 'npy':
+        return np.load(io.BytesIO(data))
+    if ext == 'json':
+        return json.loads(data)
+    return data
+
+
+class ShardWriter:
+    def __init__(self, output_dir, prefix='shard', max_size=SHARD_SIZE):
+        self.output_dir = output_dir
+        self.prefix = prefix
+        self.max_size = max_size
+        self.shards = []     # [(shard_path, records, bytes)]
+        self._tar = None
+        os.makedirs(output_dir, exist_ok=True)
+
+    def _open(self):
+        self._path = os.path.join(self.output_dir, SHARD_NAME.format(prefix=self.prefix, index=len(self.shards)))
+        self._tar = tarfile.open(partial_path(self._path), 'w', format=tarfile.GNU_FORMAT)
+        self._records = []
+
+    def _close(self, keep=True):
+        self._tar.close()
+        self._tar = None
+        if not keep:
+            os.remove(partial_path(self._path))
+            return
+        os.replace(partial_path(self._path), self._path)
+        with atomic_output(index_path(self._path)) as tmp_path, open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'shard': os.path.basename(self._path), 'records': self._records}, f, ensure_ascii=False)
+        self.shards.append((self._path, len(self._records), os.path.getsize(self._path)))
+
+    def write(self, key, members, meta=None):
+        # members: {ext: bytes, or the path of a file to copy in}; meta is stored as <key>.json and in the index
+        if '.' in key:
+            raise ValueError(f"Record key must not contain '.': {key}")
+        if self._tar is not None and self._records and self._tar.offset >= self.max_size:
+            self._close()
+        if self._tar is None:
+            self._open()
+
+        if meta is not None:
+            members = {'json': encode_member('json', meta), **members}
+        ranges = {}
+        for ext, value in members.items():
+            info = tarfile.TarInfo(f"{key}.{ext}")
+            info.mtime = int(time.time())
+            info.mode = 0o444
+            if isinstance(value, (bytes, bytearray)):
+                info.size = len(value)
+                self._tar.addfile(info, io.BytesIO(value))
+            else:
+                info.size = os.path.getsize(value)
+                with open(value, 'rb') as f:
+                    self._tar.addfile(info, f)
+            # data ends on a 512-byte block boundary right where the tar now stands
+            ranges[ext] = [self._tar.offset - -(-info.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE, info.size]
+        self._records.append({'key': key, 'members': ranges, 'meta': meta})
+
+    def close(self):
+        if self._tar is not None:
+            self._close()
+        return self.shards
+
+    def abort(self):
+        if self._tar is not None:
+            self._close(keep=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+# --- Random access: reader[i] or reader[key] -> {'key', 'json', 'npy', 'mp4', ...} decoded ---
+class ShardReader:
+    def __init__(self, shard_path):
+        with open(index_path(shard_path), encoding='utf-8') as f:
+            self.records = json.load(f)['records']
+        self._by_key = {r['key']: i for i, r in enumerate(self.records)}
+        self._f = open(shard_path, 'rb')
+
+    def __len__(self):
+        return len(self.records)
+
+    def keys(self):
+        return [r['key'] for r in self.records]
+
+    def read_member(self, i, ext):
+        offset, size = self.records[i]['members'][ext]
+        self._f.seek(offset)
+        return self._f.read(size)
+
+    def __getitem__(self, i):
+        if isinstance(i, str):
+            i = self._by_key[i]
+        record = {'key': self.records[i]['key']}
+        for ext in self.records[i]['members']:
+            record[ext] = decode_member(ext, self.read_member(i, ext))
+        return record
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# --- Sequential streaming at disk bandwidth: one pass over the tar, no index needed ---
+def iter_shard(shard_path):
+    record = None
+    with tarfile.open(shard_path, 'r|') as tar:
+        for info in tar:
+            if not info.isfile():
+                continue
+            key, ext = info.name.split('.', 1)
+            if record is not None and record['key'] != key:
+                yield record
+                record = None
+            if record is None:
+                record = {'key': key}
+            record[ext] = decode_member(ext, tar.extractfile(info).read())
+    if record is not None:
+        yield record
@@ -0,0 +1,134 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from utils.track_io import NUM_JOINTS
+
+# parent of each of the 24 joints (SMPL order, see TARGET_JOINTS_ORDERED); joint 22 is a copy of RHandOut,
+# so the 20 → 22 "bone" is not rigid and is left out
+SKELETON_PARENTS = [-1, 0, 0, 0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 9, 9, 12, 13, 14, 16, 17, 18, 19, 20, 21]
+BONES = np.array([(j, p) for j, p in enumerate(SKELETON_PARENTS) if p >= 0 and j != 22])
+
+OUTLIER_QUANTILE = 0.99   # a joint speed / acceleration is an outlier above OUTLIER_FACTOR × this quantile
+OUTLIER_FACTOR = 3.0      # of the same joint over the whole track (marker swaps, teleports)
+FLAG_LIMITS = {        # metric -> largest value that is not flagged
+    'missing_frames': 0,
+    'nan_ratio': 0.05,
+    'empty_frames': 0,
+    'speed_outliers': 0,
+    'acc_outliers': 0,
+    'bone_cv_max': 0.1,
+}
+
+
+# --- Sums over many [start, stop) row ranges at once, from one cumulative sum ---
+def _range_sums(values, starts, stops):
+    cs = np.concatenate([np.zeros((1,) + values.shape[1:]), np.cumsum(values, axis=0, dtype=np.float64)])
+    starts = np.clip(starts, 0, len(values))
+    stops = np.clip(stops, starts, len(values))
+    return cs[stops] - cs[starts]
+
+
+def _range_max(values, starts, stops):
+    # per-range max of a 1-D array, NaN for empty ranges
+    out = np.full(len(starts), np.nan)
+    starts = np.clip(starts, 0, len(values))
+    stops = np.clip(stops, starts, len(values))
+    nonempty = stops > starts
+    if nonempty.any():
+        # reduceat over interleaved (start, stop) indices: the even results are the range maxima
+        idx = np.stack([starts[nonempty], stops[nonempty]], axis=1).ravel()
+        out[nonempty] = np.maximum.reduceat(np.append(values, 0.0), idx)[::2]
+    return out
+
+
+def _outlier_thresholds(values):
+    # per column OUTLIER_FACTOR × the OUTLIER_QUANTILE of the finite entries; a plain MAD threshold would flag
+    # every fast action against a session that is mostly standing still
+    values = np.where(np.isfinite(values), values, np.nan)
+    if not np.isfinite(values).any():
+        return np.full(values.shape[1], np.inf)
+    with np.errstate(all='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)   # all-NaN joints
+        thr = OUTLIER_FACTOR * np.nanquantile(values, OUTLIER_QUANTILE, axis=0)
+    return np.where(np.isfinite(thr) & (thr > 0), thr, np.inf)
+
+
+def iloc_bounds(num_rows, starts, stops):
+    # the rows df.iloc[s:e] really returns (negative s counts from the end), as [start, stop) arrays
+    bounds = [range(num_rows)[int(s):int(e)] for s, e in zip(starts, stops)]
+    starts = np.array([r.start for r in bounds], dtype=np.int64)
+    stops = np.array([max(r.stop, r.start) for r in bounds], dtype=np.int64)
+    return starts, stops
+
+
+# --- Quality metrics of every slice of one track, all as whole-array operations ---
+# track: (F, 24, 3); slices are row ranges [starts, stops) of it; expected: annotated frame counts (or None)
+def slice_metrics(track, starts, stops, expected=None):
+    pts = np.asarray(track, dtype=np.float64).reshape(len(track), NUM_JOINTS, 3)
+    starts, stops = np.asarray(starts, dtype=np.int64), np.asarray(stops, dtype=np.int64)
+    frames = stops - starts
+    n = np.maximum(frames, 1)
+
+    # occlusion: NaN joints (NaN padding from negative offsets shows up as fully empty frames)
+    joint_nan = ~np.isfinite(pts).all(axis=-1)                                     # (F, 24)
+    frame_empty = joint_nan.all(axis=1)
+    joint_nan_ratio = _range_sums(joint_nan, starts, stops) / n[:, None]           # (S, 24)
+    rows = np.arange(len(pts))
+    next_filled = np.minimum.accumulate(np.where(~frame_empty, rows, len(pts))[::-1])[::-1]   # first non-empty at or after
+    first_filled = next_filled[np.minimum(starts, len(pts) - 1)] if len(pts) else starts
+    lead_pad = np.clip(np.minimum(first_filled, stops) - starts, 0, None)
+
+    # motion outliers: per-frame joint speed / acceleration against per-joint robust thresholds;
+    # differences are taken inside each slice only ([start, stop - 1) of the diff rows)
+    speed = np.linalg.norm(np.diff(pts, axis=0), axis=-1)                          # (F-1, 24)
+    acc = np.linalg.norm(np.diff(pts, n=2, axis=0), axis=-1)                       # (F-2, 24)
+    with np.errstate(invalid='ignore'):
+        speed_out = (speed > _outlier_thresholds(speed)).any(axis=1)
+        acc_out = (acc > _outlier_thresholds(acc)).any(axis=1)
+    frame_speed = np.where(np.isfinite(speed), speed, 0.0).max(axis=1) if speed.size else np.zeros(len(speed))
+
+    # bone-length variation: coefficient of variation of each bone within the slice
+    bone = np.linalg.norm(pts[:, BONES[:, 0]] - pts[:, BONES[:, 1]], axis=-1)      # (F, B)
+    bone_ok = np.isfinite(bone)
+    bone = np.where(bone_ok, bone, 0.0)
+    cnt = _range_sums(bone_ok, starts, stops)
+    s1, s2 = _range_sums(bone, starts, stops), _range_sums(bone * bone, starts, stops)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = s1 / cnt
+        cv = np.sqrt(np.maximum(s2 / cnt - mean ** 2, 0.0)) / mean
+    cv = np.where((cnt > 1) & (mean > 0), cv, np.nan)
+    has_cv = np.isfinite(cv).any(axis=1)
+    worst_bone = np.where(has_cv, np.argmax(np.where(np.isfinite(cv), cv, -1.0), axis=1), -1)
+
+    report = pd.DataFrame({
+        'frames': frames,
+        'expected_frames': np.asarray(expected, dtype=np.float64) if expected is not None else np.nan,
+        'nan_ratio': joint_nan_ratio.mean(axis=1),
+        'empty_frames': _range_sums(frame_empty, starts, stops).astype(np.int64),
+        'lead_pad': lead_pad,
+        'worst_joint': np.argmax(joint_nan_ratio, axis=1),
+        'worst_joint_nan': joint_nan_ratio.max(axis=1),
+        'speed_outliers': _range_sums(speed_out, starts, stops - 1).astype(np.int64),
+        'acc_outliers': _range_sums(acc_out, starts, stops - 2).astype(np.int64),
+        'max_speed': _range_max(frame_speed, starts, stops - 1),
+        'bone_cv_max': np.where(has_cv, np.nanmax(np.where(np.isfinite(cv), cv, -np.inf), axis=1), np.nan),
+        'worst_bone': [f"{BONES[b, 1]}-{BONES[b, 0]}" if b >= 0 else '' for b in worst_bone],
+    })
+    report.insert(2, 'missing_frames', report['expected_frames'] - report['frames'])
+    for j in range(NUM_JOINTS):
+        report[f"nan_{j}"] = joint_nan_ratio[:, j]
+    return report
+
+
+# --- Flags: which metrics are over their limit, and a report sorted worst first ---
+def flag_report(report, limits=FLAG_LIMITS):
+    over = pd.DataFrame({metric: (report[metric].abs() if metric == 'missing_frames' else report[metric]) > limit
+                         for metric, limit in limits.items()})
+    report = report.copy()
+    report.insert(0, 'num_flags', over.sum(axis=1))
+    names = np.array(over.columns)
+    report.insert(1, 'flags', [';'.join(names[row]) for row in over.to_numpy()])
+    return report.sort_values(['num_flags', 'nan_ratio', 'speed_outliers'], ascending=False, kind='stable') \
+        .reset_index(drop=True)
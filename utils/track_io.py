@@ -0,0 +1,86 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils import metrics
+from utils.ledger import atomic_output
+
+NUM_JOINTS = 24
+TRACK_COLUMNS = [f"{i}_{axis}" for i in range(NUM_JOINTS) for axis in ['x', 'y', 'z']]
+TRACK_FORMATS = ('csv', 'npy')
+
+
+# --- Binary track format: <name>.npy float32 array (frames, 24, 3) + <name>.json sidecar ---
+def sidecar_path(track_path):
+    return os.path.splitext(track_path)[0] + '.json'
+
+
+def track_format(track_path):
+    ext = os.path.splitext(track_path)[1].lower().lstrip('.')
+    if ext not in TRACK_FORMATS:
+        raise ValueError(f"Unknown track format '{ext}' for {track_path}, expected one of {TRACK_FORMATS}")
+    return ext
+
+
+def as_track_array(data):
+    # accept a (frames, 72) table / array or a (frames, 24, 3) array
+    arr = data.to_numpy() if isinstance(data, pd.DataFrame) else np.asarray(data)
+    return arr.reshape(len(arr), NUM_JOINTS, 3)
+
+
+def track_to_frame(track):
+    return pd.DataFrame(np.asarray(track).reshape(len(track), NUM_JOINTS * 3), columns=TRACK_COLUMNS)
+
+
+def _json_value(value):
+    # numpy scalars / arrays in the sidecar metadata (e.g. start/end from a numpy offset column) as JSON numbers
+    if isinstance(value, (np.generic, np.ndarray)):
+        return value.tolist()
+    return str(value)
+
+
+def save_track(track_path, data, **meta):
+    # np.save writes the buffer directly, so slices of a memory-mapped track are written without a text round trip
+    arr = as_track_array(data)
+    if arr.dtype != np.float32:
+        arr = arr.astype(np.float32)
+    with metrics.span('write', format='npy', frames=len(arr)), atomic_output(track_path) as tmp_path:
+        np.save(tmp_path, arr)
+    sidecar = {
+        'format': 'keypoints3d',
+        'shape': list(arr.shape),
+        'dtype': 'float32',
+        'joints': NUM_JOINTS,
+        'columns': TRACK_COLUMNS,
+        **meta,
+    }
+    with atomic_output(sidecar_path(track_path)) as tmp_path, open(tmp_path, 'w') as f:
+        json.dump(sidecar, f, indent=2, default=_json_value)
+
+
+def load_track(track_path, mmap=True):
+    # (frames, 24, 3) array; .npy tracks are memory-mapped read-only, so slicing returns views
+    if track_format(track_path) == 'npy':
+        return np.load(track_path, mmap_mode='r' if mmap else None)
+    return as_track_array(pd.read_csv(track_path, dtype=np.float64))
+
+
+def load_track_meta(track_path):
+    path = sidecar_path(track_path)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_track(track_path, data, **meta):
+    # anything but .npy is written as csv, exactly as before; both are renamed into place once complete
+    if os.path.splitext(track_path)[1].lower() == '.npy':
+        save_track(track_path, data, **meta)
+        return
+    if not isinstance(data, pd.DataFrame):
+        data = track_to_frame(data)
+    with metrics.span('write', format='csv', frames=len(data)), atomic_output(track_path) as tmp_path:
+        data.to_csv(tmp_path, index=False)
@@ -0,0 +1,106 @@
+import queue
+import threading
+import time
+
+from utils import metrics
+
+_END = object()
+
+
+# --- Bounded decode -> process -> encode pipeline ---
+# `frames` is iterated on a decoder thread, `process` runs on the calling thread and
+# `write` on an encoder thread. OpenCV releases the GIL while decoding and encoding,
+# so the three stages overlap; queue_depth bounds how many frames are held in memory.
+# Stage times are returned and, with DASE_METRICS set, logged as '<name>.decode' etc. (utils/metrics.py).
+def run_pipeline(frames, process, write, queue_depth=8, name='pipeline'):
+    decoded = queue.Queue(maxsize=queue_depth)
+    processed = queue.Queue(maxsize=queue_depth)
+    stop = threading.Event()
+    errors = []
+    stats = {'decode': 0.0, 'process': 0.0, 'encode': 0.0, 'frames': 0, 'wall': 0.0}
+
+    def put(q, item):
+        # gives up once another stage has failed
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(q):
+        while True:
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                if stop.is_set():
+                    return _END
+
+    def decoder():
+        try:
+            it = iter(frames)
+            while True:
+                t0 = time.perf_counter()
+                try:
+                    item = next(it)
+                except StopIteration:
+                    break
+                stats['decode'] += time.perf_counter() - t0
+                if not put(decoded, item):
+                    return
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            put(decoded, _END)
+
+    def encoder():
+        try:
+            while True:
+                item = get(processed)
+                if item is _END:
+                    break
+                t0 = time.perf_counter()
+                write(item)
+                stats['encode'] += time.perf_counter() - t0
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+
+    t_start = time.perf_counter()
+    threads = [threading.Thread(target=decoder, name='decoder', daemon=True),
+               threading.Thread(target=encoder, name='encoder', daemon=True)]
+    for t in threads:
+        t.start()
+    try:
+        while True:
+            item = get(decoded)
+            if item is _END:
+                break
+            t0 = time.perf_counter()
+            result = process(item)
+            stats['process'] += time.perf_counter() - t0
+            stats['frames'] += 1
+            if not put(processed, result):
+                break
+    except BaseException as e:
+        errors.append(e)
+        stop.set()
+    finally:
+        put(processed, _END)
+        for t in threads:
+            t.join()
+    stats['wall'] = time.perf_counter() - t_start
+
+    if errors:
+        raise errors[0]
+    metrics.record_stages(name, stats)
+    return stats
+
+
+def format_stage_report(stats):
+    busiest = max(('decode', 'process', 'encode'), key=lambda k: stats[k])
+    fps = stats['frames'] / stats['wall'] if stats['wall'] > 0 else 0.0
+    return (f"decode {stats['decode']:.2f}s | process {stats['process']:.2f}s | encode {stats['encode']:.2f}s"
+            f" | {stats['frames']} frames in {stats['wall']:.2f}s ({fps:.1f} fps), bottleneck: {busiest}")